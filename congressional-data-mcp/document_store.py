@@ -8,10 +8,14 @@ import os
 import json
 import hashlib
 import base64
+import io
+import sys
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Dict, List, Optional, Any
+from typing import BinaryIO, Dict, Iterable, List, Optional, Any
 import sqlite3
+import threading
+from contextlib import contextmanager
 
 # Document storage directory
 STORAGE_DIR = Path(__file__).parent / "document_storage"
@@ -20,14 +24,43 @@ STORAGE_DIR.mkdir(exist_ok=True)
 # Database for document metadata
 METADATA_DB = Path(__file__).parent / "documents.db"
 
+# Block size for streaming uploads to disk
+CHUNK_SIZE = 1 << 20
+
+_INSERT_DOCUMENT = """
+    INSERT INTO documents (
+        id, filename, title, description, content_type,
+        size, hash, uploaded_at, tags, category, full_text, metadata
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
 class DocumentStore:
     """Manages document storage and retrieval"""
     
     def __init__(self):
         self.storage_dir = STORAGE_DIR
         self.db_path = METADATA_DB
+        # Connection shared by writes inside batch(); None outside a batch.
+        # _write_lock serializes database writes from concurrent uploads.
+        self._batch_conn: Optional[sqlite3.Connection] = None
+        self._write_lock = threading.Lock()
         self._init_db()
     
+    @contextmanager
+    def batch(self):
+        """Group document writes into one connection and a single commit"""
+        if self._batch_conn is not None:
+            yield self
+            return
+        
+        self._batch_conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        try:
+            with self._batch_conn:
+                yield self
+        finally:
+            self._batch_conn.close()
+            self._batch_conn = None
+    
     def _init_db(self):
         """Initialize the document metadata database"""
         conn = sqlite3.connect(self.db_path)
@@ -54,6 +87,52 @@ class DocumentStore:
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_tags ON documents(tags)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_title ON documents(title)")
         
+        # Full-text index for search_documents, kept in step with the
+        # documents table by triggers
+        self._fts = True
+        try:
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'docs_fts'"
+            )
+            if cursor.fetchone() is None:
+                cursor.execute("""
+                    CREATE VIRTUAL TABLE docs_fts USING fts5(
+                        id UNINDEXED, title, description, full_text,
+                        tokenize='porter unicode61'
+                    )
+                """)
+                cursor.execute("""
+                    INSERT INTO docs_fts (id, title, description, full_text)
+                    SELECT id, title, description, full_text FROM documents
+                """)
+            cursor.execute("""
+                CREATE TRIGGER IF NOT EXISTS documents_fts_insert
+                AFTER INSERT ON documents BEGIN
+                    INSERT INTO docs_fts (id, title, description, full_text)
+                    VALUES (new.id, new.title, new.description, new.full_text);
+                END
+            """)
+            cursor.execute("""
+                CREATE TRIGGER IF NOT EXISTS documents_fts_delete
+                AFTER DELETE ON documents BEGIN
+                    DELETE FROM docs_fts WHERE id = old.id;
+                END
+            """)
+            cursor.execute("""
+                CREATE TRIGGER IF NOT EXISTS documents_fts_update
+                AFTER UPDATE OF title, description, full_text ON documents BEGIN
+                    UPDATE docs_fts
+                    SET title = new.title, description = new.description,
+                        full_text = new.full_text
+                    WHERE id = old.id;
+                END
+            """)
+        except sqlite3.OperationalError as e:
+            # SQLite built without FTS5; search falls back to LIKE
+            # (stderr: the stdio MCP server owns stdout)
+            print(f"Full-text search unavailable: {e}", file=sys.stderr)
+            self._fts = False
+        
         conn.commit()
         conn.close()
     
@@ -80,53 +159,175 @@ class DocumentStore:
         Returns:
             Document ID
         """
-        # Generate document ID and hash
-        doc_hash = hashlib.sha256(content).hexdigest()
+        return self.store_document_stream(
+            io.BytesIO(content), filename, title=title, description=description,
+            category=category, tags=tags, metadata=metadata
+        )
+    
+    def store_document_stream(self,
+                              fileobj: BinaryIO,
+                              filename: str,
+                              title: Optional[str] = None,
+                              description: Optional[str] = None,
+                              category: Optional[str] = None,
+                              tags: Optional[List[str]] = None,
+                              metadata: Optional[Dict] = None) -> str:
+        """
+        Store a document read from a binary file object and return its ID
+        
+        The content is hashed while it is copied to disk in CHUNK_SIZE blocks,
+        so memory use does not grow with the document size. Arguments are as
+        for store_document.
+        """
+        # Copy to a temporary file, hashing as we go; the final name
+        # depends on the hash
+        hasher = hashlib.sha256()
+        size = 0
+        tmp_path = self.storage_dir / f".upload-{os.getpid()}-{threading.get_ident()}"
+        try:
+            with open(tmp_path, 'wb') as out:
+                while True:
+                    chunk = fileobj.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    hasher.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+            
+            doc_hash = hasher.hexdigest()
+            
+            with self._write_lock:
+                return self._record_document(
+                    tmp_path, doc_hash, size, filename, title, description,
+                    category, tags, metadata
+                )
+        except BaseException:
+            # Don't leave a partial upload behind (a no-op once the file
+            # has been moved into place)
+            tmp_path.unlink(missing_ok=True)
+            raise
+    
+    def _record_document(self, tmp_path: Path, doc_hash: str, size: int,
+                         filename: str, title: Optional[str],
+                         description: Optional[str], category: Optional[str],
+                         tags: Optional[List[str]], metadata: Optional[Dict]) -> str:
+        """Move an uploaded temp file into place and insert its metadata row"""
         doc_id = doc_hash[:12]
         
         # Check if document already exists
-        conn = sqlite3.connect(self.db_path)
+        batched = self._batch_conn is not None
+        conn = self._batch_conn if batched else sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         cursor.execute("SELECT id FROM documents WHERE hash = ?", (doc_hash,))
         existing = cursor.fetchone()
         
         if existing:
-            conn.close()
+            if not batched:
+                conn.close()
+            tmp_path.unlink()
             return existing[0]
         
-        # Save file to disk
+        # Move file into place
         file_path = self.storage_dir / f"{doc_id}_{filename}"
-        with open(file_path, 'wb') as f:
-            f.write(content)
+        os.replace(tmp_path, file_path)
         
-        # Extract text content if possible
-        full_text = self._extract_text(content, filename)
+        # Extract text content if possible (only text formats are read back)
+        full_text = None
+        if filename.endswith(('.txt', '.json')):
+            full_text = self._extract_text(file_path.read_bytes(), filename)
         
         # Store metadata in database
-        cursor.execute("""
-            INSERT INTO documents (
-                id, filename, title, description, content_type,
-                size, hash, uploaded_at, tags, category, full_text, metadata
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
+        cursor.execute(_INSERT_DOCUMENT, self._document_row(
+            doc_id, doc_hash, size, filename, title, description,
+            category, tags, metadata, full_text
+        ))
+        
+        if not batched:
+            conn.commit()
+            conn.close()
+        
+        return doc_id
+    
+    def _document_row(self, doc_id: str, doc_hash: str, size: int,
+                      filename: str, title: Optional[str],
+                      description: Optional[str], category: Optional[str],
+                      tags: Optional[List[str]], metadata: Optional[Dict],
+                      full_text: Optional[str]) -> tuple:
+        """Build the parameter tuple for _INSERT_DOCUMENT"""
+        return (
             doc_id,
             filename,
             title or filename,
             description,
             self._get_content_type(filename),
-            len(content),
+            size,
             doc_hash,
             datetime.now(timezone.utc).isoformat(),
             json.dumps(tags) if tags else None,
             category,
             full_text,
             json.dumps(metadata) if metadata else None
-        ))
-        
-        conn.commit()
-        conn.close()
+        )
+    
+    def store_documents_bulk(self, documents: Iterable[Dict]) -> List[str]:
+        """
+        Store many in-memory documents in one transaction and return their IDs
         
-        return doc_id
+        Each dict takes the store_document arguments: 'content' (bytes) and
+        'filename' are required; 'title', 'description', 'category', 'tags'
+        and 'metadata' are optional. IDs are returned in input order;
+        documents already in the store return their existing ID.
+        """
+        hashed = []
+        for doc in documents:
+            content = doc['content']
+            hashed.append((hashlib.sha256(content).hexdigest(), doc))
+        if not hashed:
+            return []
+        
+        with self._write_lock:
+            batched = self._batch_conn is not None
+            conn = self._batch_conn if batched else sqlite3.connect(self.db_path)
+            try:
+                if not batched:
+                    conn.execute("BEGIN IMMEDIATE")
+                
+                # Resolve duplicates (stored or within this batch) up front
+                placeholders = ",".join("?" * len(hashed))
+                ids_by_hash = dict(conn.execute(
+                    f"SELECT hash, id FROM documents WHERE hash IN ({placeholders})",
+                    [doc_hash for doc_hash, _ in hashed]
+                ).fetchall())
+                
+                rows = []
+                for doc_hash, doc in hashed:
+                    if doc_hash in ids_by_hash:
+                        continue
+                    doc_id = doc_hash[:12]
+                    ids_by_hash[doc_hash] = doc_id
+                    
+                    content = doc['content']
+                    filename = doc['filename']
+                    (self.storage_dir / f"{doc_id}_{filename}").write_bytes(content)
+                    rows.append(self._document_row(
+                        doc_id, doc_hash, len(content), filename,
+                        doc.get('title'), doc.get('description'),
+                        doc.get('category'), doc.get('tags'), doc.get('metadata'),
+                        self._extract_text(content, filename)
+                    ))
+                
+                conn.executemany(_INSERT_DOCUMENT, rows)
+                if not batched:
+                    conn.commit()
+            except Exception:
+                if not batched:
+                    conn.rollback()
+                raise
+            finally:
+                if not batched:
+                    conn.close()
+        
+        return [ids_by_hash[doc_hash] for doc_hash, _ in hashed]
     
     def get_document(self, doc_id: str) -> Optional[Dict]:
         """Get document metadata and content"""
@@ -182,31 +383,43 @@ class DocumentStore:
         
         where_clauses = []
         params = []
-        
-        if query:
+        from_sql = "documents d"
+        order_sql = "d.uploaded_at DESC"
+        
+        words = query.split() if query else []
+        if words and self._fts:
+            # Ranked full-text match; each word is quoted so user input is
+            # never parsed as FTS5 query syntax, and matches as a prefix
+            from_sql = "docs_fts f JOIN documents d ON d.id = f.id"
+            order_sql = "f.rank"
+            where_clauses.append("docs_fts MATCH ?")
+            params.append(" ".join(
+                '"' + word.replace('"', '""') + '"*' for word in words
+            ))
+        elif query:
             where_clauses.append(
-                "(title LIKE ? OR description LIKE ? OR full_text LIKE ?)"
+                "(d.title LIKE ? OR d.description LIKE ? OR d.full_text LIKE ?)"
             )
             query_param = f"%{query}%"
             params.extend([query_param, query_param, query_param])
         
         if category:
-            where_clauses.append("category = ?")
+            where_clauses.append("d.category = ?")
             params.append(category)
         
         if tags:
             for tag in tags:
-                where_clauses.append("tags LIKE ?")
+                where_clauses.append("d.tags LIKE ?")
                 params.append(f"%{tag}%")
         
         where_sql = " AND ".join(where_clauses) if where_clauses else "1=1"
         
         cursor.execute(f"""
-            SELECT id, filename, title, description, category, tags, 
-                   size, uploaded_at
-            FROM documents
+            SELECT d.id, d.filename, d.title, d.description, d.category, d.tags,
+                   d.size, d.uploaded_at
+            FROM {from_sql}
             WHERE {where_sql}
-            ORDER BY uploaded_at DESC
+            ORDER BY {order_sql}
         """, params)
         
         results = []
@@ -449,16 +662,15 @@ def load_default_documents():
     """Load default Congressional knowledge documents"""
     store = DocumentStore()
     
-    for doc_key, doc_info in DEFAULT_DOCUMENTS.items():
-        content = doc_info.pop('content').encode('utf-8')
-        filename = f"{doc_key}.txt"
-        
-        doc_id = store.store_document(
-            content=content,
-            filename=filename,
-            **doc_info
-        )
-        print(f"Loaded document: {doc_info['title']} (ID: {doc_id})")
+    documents = [
+        {**doc_info, 'content': doc_info['content'].encode('utf-8'),
+         'filename': f"{doc_key}.txt"}
+        for doc_key, doc_info in DEFAULT_DOCUMENTS.items()
+    ]
+    doc_ids = store.store_documents_bulk(documents)
+    
+    for doc, doc_id in zip(documents, doc_ids):
+        print(f"Loaded document: {doc['title']} (ID: {doc_id})")
     
     return store
 
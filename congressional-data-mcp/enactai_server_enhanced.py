@@ -11,6 +11,8 @@ import hashlib
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Any
 import httpx
+from httpx_limiter import AsyncRateLimitedTransport, Rate
+from httpx_limiter.aiolimiter import AiolimiterAsyncLimiter
 from mcp.server import Server, NotificationOptions
 from mcp.server.models import InitializationOptions
 import mcp.server.stdio
@@ -24,12 +26,26 @@ GOVINFO_API_KEY = os.getenv("GOVINFO_API_KEY", "")
 # Create server
 server = Server("enactai-data")
 
-# HTTP client with retries
-client = httpx.AsyncClient(
-    timeout=30.0,
-    limits=httpx.Limits(max_keepalive_connections=10, max_connections=20),
-    follow_redirects=True
-)
+# Client-side pacing (requests per second). Congress.gov allows 5000 req/hour
+# per key; GovInfo has its own independent quota.
+CONGRESS_RPS = int(os.getenv("CONGRESS_RPS", "2"))
+GOVINFO_RPS = int(os.getenv("GOVINFO_RPS", "2"))
+
+def create_rate_limited_client(rps: int) -> httpx.AsyncClient:
+    """Create an HTTP client paced to at most `rps` requests per second"""
+    transport = AsyncRateLimitedTransport.create(
+        AiolimiterAsyncLimiter.create(Rate.create(magnitude=rps, duration=1)),
+        limits=httpx.Limits(max_keepalive_connections=10, max_connections=20)
+    )
+    return httpx.AsyncClient(
+        timeout=30.0,
+        transport=transport,
+        follow_redirects=True
+    )
+
+# HTTP clients, one per API so each is paced against its own quota
+client = create_rate_limited_client(CONGRESS_RPS)
+govinfo_client = create_rate_limited_client(GOVINFO_RPS)
 
 # Document storage
 doc_store = DocumentStore()
@@ -694,7 +710,7 @@ async def handle_call_tool(name: str, arguments: dict) -> list[types.TextContent
             if arguments.get("to_date"):
                 params["publishedTo"] = arguments["to_date"]
             
-            response = await client.get(url, params=params)
+            response = await govinfo_client.get(url, params=params)
             response.raise_for_status()
             
             data = response.json()
@@ -764,7 +780,7 @@ async def handle_call_tool(name: str, arguments: dict) -> list[types.TextContent
                     "pageSize": 1
                 }
                 
-                govinfo_response = await client.get("https://api.govinfo.gov/search", params=govinfo_params)
+                govinfo_response = await govinfo_client.get("https://api.govinfo.gov/search", params=govinfo_params)
                 if govinfo_response.status_code == 200:
                     govinfo_data = govinfo_response.json()
                     if govinfo_data.get("results"):
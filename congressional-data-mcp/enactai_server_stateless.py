@@ -8,6 +8,8 @@ import os
 import json
 import asyncio
 import httpx
+from httpx_limiter import AsyncRateLimitedTransport, Rate
+from httpx_limiter.aiolimiter import AiolimiterAsyncLimiter
 from datetime import datetime, timedelta, timezone
 from typing import Dict, Any, Optional, List
 import hashlib
@@ -33,8 +35,20 @@ REQUIRE_AUTH = os.getenv("REQUIRE_AUTH", "true").lower() == "true"
 server = Server("enactai-data-stateless")
 token_manager = TokenManager()
 
+# Client-side pacing (requests per second). Congress.gov allows 5000 req/hour
+# per key; this server only calls Congress.gov.
+CONGRESS_RPS = int(os.getenv("CONGRESS_RPS", "2"))
+
+def create_rate_limited_client(rps: int) -> httpx.AsyncClient:
+    """Create an HTTP client paced to at most `rps` requests per second"""
+    transport = AsyncRateLimitedTransport.create(
+        AiolimiterAsyncLimiter.create(Rate.create(magnitude=rps, duration=1)),
+        limits=httpx.Limits(max_keepalive_connections=10, max_connections=20)
+    )
+    return httpx.AsyncClient(timeout=30.0, transport=transport)
+
 # HTTP client for external APIs
-client = httpx.AsyncClient(timeout=30.0)
+client = create_rate_limited_client(CONGRESS_RPS)
 
 # Cache for API responses (TTL: 5 minutes)
 cache: Dict[str, tuple[Any, datetime]] = {}
@@ -303,7 +317,7 @@ async def handle_call_tool(
         
         # Record authentication
         if token_info.get('id') != 'noauth':
-            token_manager.record_usage(token_info['id'], 'authenticate')
+            token_manager.record_usage(token_info['id'], 'authenticate', ts=token_info.get('last_used'))
         
         return [types.TextContent(
             type="text",
@@ -342,7 +356,7 @@ async def handle_call_tool(
         
         # Record usage
         if token_info.get('id') != 'noauth':
-            token_manager.record_usage(token_info['id'], name)
+            token_manager.record_usage(token_info['id'], name, ts=token_info.get('last_used'))
     
     # Remove token from arguments before processing
     args_without_token = {k: v for k, v in arguments.items() if k != 'token'}
@@ -55,7 +55,7 @@ elif command -v python &> /dev/null; then
     print_success "Python $PYTHON_VERSION found"
 else
     print_error "Python is not installed!"
-    print_warning "Please install Python 3.9 or later from: https://www.python.org/downloads/"
+    print_warning "Please install Python 3.10 or later from: https://www.python.org/downloads/"
     exit 1
 fi
 
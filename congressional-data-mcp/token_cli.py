@@ -7,16 +7,94 @@ Command-line interface for managing API tokens
 import sys
 import argparse
 import json
-from datetime import datetime
+import re
+import functools
+from datetime import datetime, timezone
 from typing import List, Optional
 import os
+import sqlite3
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Add the current directory to the path so we can import our modules
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from token_manager import TokenManager, get_token_manager
-from token_models import TokenPermission
-from token_security import mask_token_for_display
+# Splits comma-separated option values, absorbing whitespace around commas
+_CSV = re.compile(r'\s*,\s*').split
+
+# Destructive commands only prompt when a human can answer
+_IS_TTY = sys.stdin.isatty()
+
+
+def _confirm(args, question: str, cancelled: str) -> Optional[int]:
+    """
+    Confirm a destructive command unless --force was given.
+    
+    Returns None to go ahead, or the exit code to stop with: 1 when stdin is
+    not interactive (nobody can answer), 0 when the user declines.
+    """
+    if args.force:
+        return None
+    if not _IS_TTY:
+        print("Refusing destructive operation without --force on non-interactive stdin.")
+        return 1
+    response = input(f"{question} (y/N): ")
+    if response.lower() != 'y':
+        print(cancelled)
+        return 0
+    return None
+
+
+def _positive_int(value: str) -> int:
+    """argparse type for options that must be an integer >= 1."""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: '{value}'")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
+
+def _dumps_element(obj) -> str:
+    """
+    Serialize obj as an element of an indented JSON array.
+    
+    Matches the layout _write_json gives a whole list, so streamed and
+    buffered output are identical.
+    """
+    if orjson is None:
+        text = json.dumps(obj, indent=2)
+    else:
+        text = orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode()
+    return "  " + text.replace("\n", "\n  ")
+
+
+def _write_json(obj):
+    """Write obj to stdout as indented JSON, using orjson when available."""
+    if orjson is None:
+        print(json.dumps(obj, indent=2))
+        return
+    # orjson emits bytes; write them straight to the binary buffer
+    sys.stdout.flush()
+    sys.stdout.buffer.write(orjson.dumps(obj, option=orjson.OPT_INDENT_2))
+    sys.stdout.buffer.write(b"\n")
+
+
+@functools.lru_cache(maxsize=None)
+def _permission_map() -> dict:
+    """Map permission values to TokenPermission members, built once on first use."""
+    from token_models import TokenPermission
+    return {p.value: p for p in TokenPermission}
+
+
+@functools.lru_cache(maxsize=None)
+def _valid_permissions() -> str:
+    """Comma-separated permission values, built once on first use."""
+    return ', '.join(_permission_map())
 
 
 class TokenCLI:
@@ -24,68 +102,112 @@ class TokenCLI:
     
     def __init__(self):
         """Initialize the CLI."""
-        self.manager = get_token_manager()
+        self._manager = None
+        self._info = None
+    
+    @property
+    def manager(self):
+        """Token manager, opened on first use so --help and usage errors stay cheap."""
+        if self._manager is None:
+            from token_manager import get_token_manager
+            self._manager = get_token_manager()
+        return self._manager
+    
+    def get_token_info(self, identifier):
+        """Look up token details, memoized for the life of this process."""
+        if self._info is None:
+            self._info = functools.lru_cache(maxsize=128)(self.manager.get_token_info)
+        return self._info(identifier)
+    
+    def _invalidate_token_info(self):
+        """Drop memoized token details after a token is modified."""
+        if self._info is not None:
+            self._info.cache_clear()
+    
+    def _find_token(self, identifier):
+        """Look up a token by ID or name, printing why when there is no single match."""
+        token_info = self.get_token_info(identifier)
+        
+        if not token_info:
+            print(f"Token not found: {identifier}")
+            return None
+        
+        if 'error' in token_info:
+            print(f"Error: {token_info['error']}")
+            return None
+        
+        return token_info
     
     def create_token(self, args):
         """Create a new token."""
-        print(f"Creating token '{args.name}'...")
+        name, perm_str, rate_limit = args.name, args.permissions, args.rate_limit
+        tools_arg, ips_arg, expires_in_days = args.allowed_tools, args.ip_whitelist, args.expires_in_days
+        
+        print(f"Creating token '{name}'...")
         
         # Parse permissions
-        try:
-            permissions = TokenPermission(args.permissions)
-        except ValueError:
-            print(f"Error: Invalid permission level '{args.permissions}'")
-            print(f"Valid options: {', '.join([p.value for p in TokenPermission])}")
+        permissions = _permission_map().get(perm_str)
+        if permissions is None:
+            print(f"Error: Invalid permission level '{perm_str}'")
+            print(f"Valid options: {_valid_permissions()}")
             return 1
         
         # Parse allowed tools
         allowed_tools = None
-        if args.allowed_tools:
-            allowed_tools = [tool.strip() for tool in args.allowed_tools.split(',')]
+        if tools_arg:
+            allowed_tools = tuple(t for t in _CSV(tools_arg.strip()) if t)
         
         # Parse IP whitelist
         ip_whitelist = None
-        if args.ip_whitelist:
-            ip_whitelist = [ip.strip() for ip in args.ip_whitelist.split(',')]
+        if ips_arg:
+            ip_whitelist = tuple(ip for ip in _CSV(ips_arg.strip()) if ip)
         
         # Create the token
-        success, message, token = self.manager.create_token(
-            name=args.name,
-            description=args.description or "",
-            permissions=permissions,
-            rate_limit=args.rate_limit,
-            allowed_tools=allowed_tools,
-            ip_whitelist=ip_whitelist,
-            expires_in_days=args.expires_in_days
-        )
-        
-        if success:
-            print("✓ Token created successfully!")
-            print(f"  Name: {args.name}")
-            print(f"  Token: {token}")
-            print(f"  Permissions: {args.permissions}")
-            print(f"  Rate Limit: {args.rate_limit} requests/hour")
-            
-            if allowed_tools:
-                print(f"  Allowed Tools: {', '.join(allowed_tools)}")
-            
-            if ip_whitelist:
-                print(f"  IP Whitelist: {', '.join(ip_whitelist)}")
-            
-            if args.expires_in_days:
-                print(f"  Expires: {args.expires_in_days} days from now")
-            
-            print("\n⚠️  IMPORTANT: Save this token securely. It cannot be retrieved again!")
-            
-        else:
-            print(f"✗ Error: {message}")
+        try:
+            token_id, token = self.manager.create_token(
+                name,
+                permissions.value,
+                expires_in_days,
+                description=args.description or "",
+                rate_limit=rate_limit,
+                allowed_tools=allowed_tools,
+                ip_whitelist=ip_whitelist
+            )
+        except sqlite3.Error as e:
+            print(f"✗ Error: {e}")
             return 1
         
+        print("✓ Token created successfully!")
+        print(f"  ID: {token_id}")
+        print(f"  Name: {name}")
+        print(f"  Token: {token}")
+        print(f"  Permissions: {perm_str}")
+        print(f"  Rate Limit: {rate_limit} requests/hour")
+        
+        if allowed_tools:
+            print(f"  Allowed Tools: {', '.join(allowed_tools)}")
+        
+        if ip_whitelist:
+            print(f"  IP Whitelist: {', '.join(ip_whitelist)}")
+        
+        if expires_in_days:
+            print(f"  Expires: {expires_in_days} days from now")
+        
+        print("\n⚠️  IMPORTANT: Save this token securely. It cannot be retrieved again!")
+        
         return 0
     
     def list_tokens(self, args):
         """List all tokens."""
-        tokens = self.manager.list_tokens(include_inactive=args.include_inactive)
+        if args.format == 'json' and not args.with_stats:
+            return self._stream_tokens_json(args.include_inactive)
+        
+        if args.with_stats:
+            tokens = self.manager.list_tokens_with_stats(
+                include_inactive=args.include_inactive, hours=24
+            )
+        else:
+            tokens = self.manager.list_tokens(active_only=not args.include_inactive)
         
         if not tokens:
             print("No tokens found.")
@@ -97,134 +219,175 @@ class TokenCLI:
         
         # Format output
         if args.format == 'json':
-            print(json.dumps(tokens, indent=2))
+            _write_json(tokens)
         else:
-            # Table format
-            print(f"{'ID':<16} {'Name':<20} {'Permissions':<12} {'Active':<8} {'Usage':<8} {'Created':<12}")
-            print("-" * 80)
+            # Table format, collected and written to stdout in one call.
+            # Header and rows share the same column widths.
+            fmt = "{:<16} {:<20} {:<12} {:<8} {:<8} {:<12}".format
+            stats_fmt = " {:<10} {:<8}".format
+            
+            header = fmt('ID', 'Name', 'Permissions', 'Active', 'Usage', 'Created')
+            if args.with_stats:
+                header += stats_fmt('Req (24h)', 'Errors')
+            out = [header, "-" * len(header)]
+            append = out.append
             
             for token in tokens:
-                status = "✓" if token['is_active'] else "✗"
-                created = datetime.fromisoformat(token['created_at']).strftime('%Y-%m-%d')
+                status = "✓" if token['active'] else "✗"
+                # ISO-8601 timestamps already start with YYYY-MM-DD
+                created = token['created_at'][:10]
                 
-                print(f"{token['id'][:16]:<16} {token['name'][:20]:<20} "
-                      f"{token['permissions']:<12} {status:<8} {token['usage_count']:<8} {created:<12}")
+                row = fmt(token['id'][:16], token['name'][:20], token['permissions'],
+                          status, token['usage_count'], created)
+                if args.with_stats:
+                    row += stats_fmt(token['requests'], token['errors'])
+                append(row)
+            
+            sys.stdout.write("\n".join(out) + "\n")
         
         return 0
     
+    def _stream_tokens_json(self, include_inactive):
+        """Write tokens as a JSON array, one row at a time."""
+        # Open the manager and fetch the first row before writing anything,
+        # so a failure there doesn't leave a dangling '[' on stdout
+        tokens = iter(self.manager.iter_tokens(include_inactive=include_inactive))
+        first = next(tokens, None)
+        
+        write = sys.stdout.write
+        if first is None:
+            write('[]\n')
+            return 0
+        write('[\n')
+        write(_dumps_element(first))
+        for token in tokens:
+            write(',\n')
+            write(_dumps_element(token))
+        write('\n]\n')
+        return 0
+    
     def show_token(self, args):
         """Show detailed information about a token."""
-        token_info = self.manager.get_token_info(args.identifier)
-        
-        if not token_info:
-            print(f"Token not found: {args.identifier}")
+        token_info = self._find_token(args.identifier)
+        if token_info is None:
             return 1
         
-        if 'error' in token_info:
-            print(f"Error: {token_info['error']}")
-            return 1
+        # Requests over the last 24 hours
+        usage_stats = self.manager.get_token_stats(token_info['id'], days=1)
         
         if args.format == 'json':
-            print(json.dumps(token_info, indent=2))
+            _write_json({**token_info, 'usage_stats': usage_stats})
         else:
             # Detailed format
+            ti = token_info
+            fromiso = datetime.fromisoformat
+            now = datetime.now(timezone.utc)
             print(f"Token Information:")
-            print(f"  ID: {token_info['id']}")
-            print(f"  Name: {token_info['name']}")
-            print(f"  Description: {token_info['description'] or 'None'}")
-            print(f"  Permissions: {token_info['permissions']}")
-            print(f"  Rate Limit: {token_info['rate_limit']} requests/hour")
-            print(f"  Active: {'Yes' if token_info['is_active'] else 'No'}")
-            print(f"  Created: {datetime.fromisoformat(token_info['created_at']).strftime('%Y-%m-%d %H:%M:%S')}")
+            print(f"  ID: {ti['id']}")
+            print(f"  Name: {ti['name']}")
+            print(f"  Description: {ti['description'] or 'None'}")
+            print(f"  Permissions: {ti['permissions']}")
+            print(f"  Rate Limit: {ti['rate_limit']} requests/hour")
+            print(f"  Active: {'Yes' if ti['active'] else 'No'}")
+            print(f"  Created: {fromiso(ti['created_at']).strftime('%Y-%m-%d %H:%M:%S')}")
             
-            if token_info['last_used_at']:
-                print(f"  Last Used: {datetime.fromisoformat(token_info['last_used_at']).strftime('%Y-%m-%d %H:%M:%S')}")
+            if ti['last_used']:
+                print(f"  Last Used: {fromiso(ti['last_used']).strftime('%Y-%m-%d %H:%M:%S')}")
             else:
                 print(f"  Last Used: Never")
             
-            print(f"  Usage Count: {token_info['usage_count']}")
+            print(f"  Usage Count: {ti['usage_count']}")
             
-            if token_info['expires_at']:
-                expires = datetime.fromisoformat(token_info['expires_at'])
+            if ti['expires_at']:
+                expires = fromiso(ti['expires_at'])
                 print(f"  Expires: {expires.strftime('%Y-%m-%d %H:%M:%S')}")
-                if expires < datetime.now():
+                # astimezone() treats naive timestamps as local time, so both
+                # naive and UTC-aware values compare safely against now
+                if expires.astimezone(timezone.utc) < now:
                     print("    ⚠️  EXPIRED")
             else:
                 print(f"  Expires: Never")
             
-            if token_info['allowed_tools']:
-                print(f"  Allowed Tools: {', '.join(token_info['allowed_tools'])}")
+            if ti['allowed_tools']:
+                print(f"  Allowed Tools: {', '.join(ti['allowed_tools'])}")
             else:
                 print(f"  Allowed Tools: All")
             
-            if token_info['ip_whitelist']:
-                print(f"  IP Whitelist: {', '.join(token_info['ip_whitelist'])}")
+            if ti['ip_whitelist']:
+                print(f"  IP Whitelist: {', '.join(ti['ip_whitelist'])}")
             else:
                 print(f"  IP Whitelist: All IPs allowed")
             
-            if not token_info['is_active']:
-                print(f"  Revoked: {datetime.fromisoformat(token_info['revoked_at']).strftime('%Y-%m-%d %H:%M:%S')}")
-                print(f"  Revoked By: {token_info['revoked_by']}")
-                print(f"  Revoked Reason: {token_info['revoked_reason']}")
+            # Tokens deactivated by expiry cleanup carry no revocation details
+            if ti['revoked_at']:
+                print(f"  Revoked: {fromiso(ti['revoked_at']).strftime('%Y-%m-%d %H:%M:%S')}")
+                print(f"  Revoked By: {ti['revoked_by']}")
+                print(f"  Revoked Reason: {ti['revoked_reason']}")
             
             # Usage statistics
-            usage_stats = token_info.get('usage_stats', {})
-            if usage_stats and not usage_stats.get('error'):
-                print(f"\n24-Hour Usage Statistics:")
-                print(f"  Total Requests: {usage_stats['total_requests']}")
-                print(f"  Successful Requests: {usage_stats['successful_requests']}")
-                print(f"  Error Rate: {usage_stats['error_rate']:.2%}")
-                if usage_stats['avg_response_time_ms']:
-                    print(f"  Avg Response Time: {usage_stats['avg_response_time_ms']:.1f}ms")
-                
-                if usage_stats['tools_usage']:
-                    print(f"  Top Tools Used:")
-                    for tool in usage_stats['tools_usage'][:5]:
-                        print(f"    {tool['tool_name']}: {tool['count']} requests")
+            total = usage_stats['total_requests']
+            print(f"\n24-Hour Usage Statistics:")
+            print(f"  Total Requests: {total}")
+            print(f"  Successful Requests: {total - usage_stats['errors']}")
+            print(f"  Error Rate: {usage_stats['errors'] / total if total else 0:.2%}")
+            
+            if usage_stats['top_endpoints']:
+                print(f"  Top Tools Used:")
+                for tool in usage_stats['top_endpoints'][:5]:
+                    print(f"    {tool['endpoint']}: {tool['count']} requests")
         
         return 0
     
     def revoke_token(self, args):
         """Revoke a token."""
-        if not args.force:
-            response = input(f"Are you sure you want to revoke token '{args.identifier}'? (y/N): ")
-            if response.lower() != 'y':
-                print("Revocation cancelled.")
-                return 0
-        
-        success, message = self.manager.revoke_token(
-            args.identifier,
+        token_info = self._find_token(args.identifier)
+        if token_info is None:
+            return 1
+        
+        stop = _confirm(args, f"Are you sure you want to revoke token '{args.identifier}'?",
+                        "Revocation cancelled.")
+        if stop is not None:
+            return stop
+        
+        revoked = self.manager.revoke_token(
+            token_info['id'],
             revoked_by=args.revoked_by or "cli",
             reason=args.reason or "Manual revocation via CLI"
         )
         
-        if success:
-            print(f"✓ {message}")
+        if revoked:
+            self._invalidate_token_info()
+            print(f"✓ Token '{token_info['name']}' ({token_info['id']}) revoked")
         else:
-            print(f"✗ Error: {message}")
+            print(f"✗ Error: Token not found: {token_info['id']}")
             return 1
         
         return 0
     
     def rotate_token(self, args):
         """Rotate a token."""
-        if not args.force:
-            response = input(f"Are you sure you want to rotate token '{args.identifier}'? (y/N): ")
-            if response.lower() != 'y':
-                print("Rotation cancelled.")
-                return 0
-        
-        success, message, new_token = self.manager.rotate_token(
-            args.identifier,
+        token_info = self._find_token(args.identifier)
+        if token_info is None:
+            return 1
+        
+        stop = _confirm(args, f"Are you sure you want to rotate token '{args.identifier}'?",
+                        "Rotation cancelled.")
+        if stop is not None:
+            return stop
+        
+        rotated = self.manager.rotate_token(
+            token_info['id'],
             revoked_by=args.revoked_by or "cli"
         )
         
-        if success:
-            print(f"✓ {message}")
+        if rotated:
+            new_id, new_token = rotated
+            self._invalidate_token_info()
+            print(f"✓ Token '{token_info['name']}' rotated; new ID: {new_id}")
             print(f"New Token: {new_token}")
             print("\n⚠️  IMPORTANT: Save this new token securely. The old token is now revoked!")
         else:
-            print(f"✗ Error: {message}")
+            print(f"✗ Error: Token is not active: {token_info['id']}")
             return 1
         
         return 0
@@ -233,12 +396,8 @@ class TokenCLI:
         """Show system analytics."""
         analytics = self.manager.get_analytics(hours=args.hours)
         
-        if 'error' in analytics:
-            print(f"Error: {analytics['error']}")
-            return 1
-        
         if args.format == 'json':
-            print(json.dumps(analytics, indent=2))
+            _write_json(analytics)
         else:
             print(f"System Analytics ({args.hours} hours):")
             print(f"  Total Tokens: {analytics['total_tokens']}")
@@ -256,13 +415,14 @@ class TokenCLI:
     
     def cleanup(self, args):
         """Clean up expired tokens and old records."""
-        if not args.force:
-            response = input("Are you sure you want to clean up expired tokens? (y/N): ")
-            if response.lower() != 'y':
-                print("Cleanup cancelled.")
-                return 0
+        stop = _confirm(args, "Are you sure you want to clean up expired tokens?",
+                        "Cleanup cancelled.")
+        if stop is not None:
+            return stop
         
-        expired_tokens, cleaned_records = self.manager.cleanup_expired_tokens()
+        expired_tokens, cleaned_records = self.manager.cleanup_expired_tokens(
+            batch_size=args.batch_size
+        )
         
         print(f"Cleanup completed:")
         print(f"  Expired tokens revoked: {expired_tokens}")
@@ -317,6 +477,7 @@ Examples:
     create_parser.add_argument('--allowed-tools', help='Comma-separated list of allowed tools')
     create_parser.add_argument('--ip-whitelist', help='Comma-separated list of allowed IPs/CIDR blocks')
     create_parser.add_argument('--expires-in-days', type=int, help='Token expiration in days')
+    create_parser.set_defaults(func=TokenCLI.create_token)
     
     # List tokens command
     list_parser = subparsers.add_parser('list', help='List all tokens')
@@ -324,12 +485,16 @@ Examples:
                             help='Include revoked/inactive tokens')
     list_parser.add_argument('--format', choices=['table', 'json'], default='table',
                             help='Output format')
+    list_parser.add_argument('--with-stats', action='store_true',
+                            help='Include 24-hour request and error counts per token')
+    list_parser.set_defaults(func=TokenCLI.list_tokens)
     
     # Show token command
     show_parser = subparsers.add_parser('show', help='Show detailed token information')
     show_parser.add_argument('identifier', help='Token ID or name')
     show_parser.add_argument('--format', choices=['detail', 'json'], default='detail',
                             help='Output format')
+    show_parser.set_defaults(func=TokenCLI.show_token)
     
     # Revoke token command
     revoke_parser = subparsers.add_parser('revoke', help='Revoke a token')
@@ -337,12 +502,14 @@ Examples:
     revoke_parser.add_argument('--reason', help='Reason for revocation')
     revoke_parser.add_argument('--revoked-by', help='Who is revoking the token')
     revoke_parser.add_argument('--force', action='store_true', help='Skip confirmation')
+    revoke_parser.set_defaults(func=TokenCLI.revoke_token)
     
     # Rotate token command
     rotate_parser = subparsers.add_parser('rotate', help='Rotate a token (create new, revoke old)')
     rotate_parser.add_argument('identifier', help='Token ID or name')
     rotate_parser.add_argument('--revoked-by', help='Who is rotating the token')
     rotate_parser.add_argument('--force', action='store_true', help='Skip confirmation')
+    rotate_parser.set_defaults(func=TokenCLI.rotate_token)
     
     # Analytics command
     analytics_parser = subparsers.add_parser('analytics', help='View system analytics')
@@ -350,40 +517,25 @@ Examples:
                                  help='Time period in hours (default: 24)')
     analytics_parser.add_argument('--format', choices=['detail', 'json'], default='detail',
                                  help='Output format')
+    analytics_parser.set_defaults(func=TokenCLI.analytics)
     
     # Cleanup command
     cleanup_parser = subparsers.add_parser('cleanup', help='Clean up expired tokens and old records')
     cleanup_parser.add_argument('--force', action='store_true', help='Skip confirmation')
+    cleanup_parser.add_argument('--batch-size', type=_positive_int, default=1000,
+                               help='Usage records deleted per statement (default: 1000)')
+    cleanup_parser.set_defaults(func=TokenCLI.cleanup)
     
     # Parse arguments
     args = parser.parse_args()
     
-    if not args.command:
+    if not getattr(args, 'func', None):
         parser.print_help()
         return 1
     
-    # Initialize CLI
-    cli = TokenCLI()
-    
     # Execute command
     try:
-        if args.command == 'create':
-            return cli.create_token(args)
-        elif args.command == 'list':
-            return cli.list_tokens(args)
-        elif args.command == 'show':
-            return cli.show_token(args)
-        elif args.command == 'revoke':
-            return cli.revoke_token(args)
-        elif args.command == 'rotate':
-            return cli.rotate_token(args)
-        elif args.command == 'analytics':
-            return cli.analytics(args)
-        elif args.command == 'cleanup':
-            return cli.cleanup(args)
-        else:
-            print(f"Unknown command: {args.command}")
-            return 1
+        return args.func(TokenCLI(), args)
     
     except KeyboardInterrupt:
         print("\nOperation cancelled.")
@@ -1,13 +1,25 @@
 """
 Token Management Configuration
 Configuration management for the token system with environment variables and defaults
+
+Importing this module does not read any configuration. The config file and
+environment are parsed on first use of get_config(), get_config_manager()
+or the module attribute CONFIG.
 """
 
 import os
-from typing import Optional, Dict, Any, List
-from dataclasses import dataclass
+import tempfile
+from typing import Optional, Dict, Any, List, Tuple
+from dataclasses import dataclass, asdict
 from pathlib import Path
 import json
+import copy
+import functools
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 
 @dataclass
@@ -35,6 +47,7 @@ class RateLimitConfig:
     default_rate_limit: int = 1000  # requests per hour
     window_hours: int = 1
     burst_allowance: int = 50  # additional requests allowed in short bursts
+    backend: str = "memory"  # "memory" (per process) or "database" (shared, SQL)
 
 
 @dataclass
@@ -87,11 +100,109 @@ class TokenManagementConfig:
     govinfo_api_key: str = ""
 
 
+# Parsed config files keyed by path: (st_mtime_ns, st_size, parsed contents)
+_FILE_CACHE: Dict[str, Tuple[int, int, Dict[str, Any]]] = {}
+
+
+_TRUE = frozenset({"1", "true", "yes", "on", "TRUE", "True"})
+
+
+def _as_bool(value: str) -> bool:
+    """Interpret an environment variable value as a boolean."""
+    return value in _TRUE or value.lower() in _TRUE
+
+
+# Environment overrides: (variable, config section or None for top level, field, cast)
+_ENV_SPEC = [
+    # Database configuration
+    ("TOKEN_DB_PATH", "database", "path", str),
+    ("TOKEN_DB_BACKUP_ENABLED", "database", "backup_enabled", _as_bool),
+    ("TOKEN_DB_CLEANUP_DAYS", "database", "cleanup_days", int),
+    # Security configuration
+    ("TOKEN_SECRET_KEY", "security", "secret_key", str),
+    ("TOKEN_PREFIX", "security", "token_prefix", str),
+    ("TOKEN_LENGTH", "security", "token_length", int),
+    ("REQUIRE_HTTPS", "security", "require_https", _as_bool),
+    # Rate limiting configuration
+    ("DEFAULT_RATE_LIMIT", "rate_limiting", "default_rate_limit", int),
+    ("RATE_LIMIT_WINDOW_HOURS", "rate_limiting", "window_hours", int),
+    ("RATE_LIMIT_BACKEND", "rate_limiting", "backend", str),
+    # Analytics configuration
+    ("ANALYTICS_ENABLED", "analytics", "enabled", _as_bool),
+    ("ANALYTICS_RETENTION_DAYS", "analytics", "retention_days", int),
+    ("DASHBOARD_PORT", "analytics", "dashboard_port", int),
+    # Server configuration
+    ("PORT", None, "server_port", int),
+    ("HOST", None, "server_host", str),
+    ("DEBUG", None, "debug", _as_bool),
+    # API keys
+    ("CONGRESS_GOV_API_KEY", None, "congress_api_key", str),
+    ("GOVINFO_API_KEY", None, "govinfo_api_key", str),
+]
+
+
+@functools.lru_cache(maxsize=4)
+def _validate(db_path: str, server_port: int, dashboard_port: int,
+              default_rate_limit: int, retention_days: int,
+              has_congress_key: bool, rate_limit_backend: str = "memory") -> Tuple[str, ...]:
+    """Validate configuration values; memoized on the values themselves."""
+    issues = []
+    
+    # Check required API keys
+    if not has_congress_key:
+        issues.append("CONGRESS_GOV_API_KEY is not set")
+    
+    # Check database path is writable
+    db_dir = Path(db_path).parent
+    if not db_dir.exists():
+        try:
+            db_dir.mkdir(parents=True, exist_ok=True)
+        except Exception:
+            issues.append(f"Cannot create database directory: {db_dir}")
+    
+    # Check port availability
+    if not (1 <= server_port <= 65535):
+        issues.append(f"Invalid server port: {server_port}")
+    
+    if not (1 <= dashboard_port <= 65535):
+        issues.append(f"Invalid dashboard port: {dashboard_port}")
+    
+    # Check rate limiting values
+    if default_rate_limit < 1:
+        issues.append("Default rate limit must be at least 1")
+    
+    if rate_limit_backend not in ("memory", "database"):
+        issues.append(f"Invalid rate limit backend: {rate_limit_backend} (use 'memory' or 'database')")
+    
+    # Check analytics retention
+    if retention_days < 1:
+        issues.append("Analytics retention days must be at least 1")
+    
+    return tuple(issues)
+
+
 class ConfigManager:
-    """Configuration manager for the token system."""
+    """Configuration manager for the token system.
+    
+    One instance exists per config file; constructing ConfigManager again for
+    the same file returns the already-loaded instance.
+    """
+    
+    _instances: Dict[str, "ConfigManager"] = {}
+    
+    def __new__(cls, config_file: Optional[str] = None):
+        config_file = config_file or os.getenv("TOKEN_CONFIG_FILE", "token_config.json")
+        instance = cls._instances.get(config_file)
+        if instance is None:
+            instance = super().__new__(cls)
+            cls._instances[config_file] = instance
+        return instance
     
     def __init__(self, config_file: Optional[str] = None):
         """Initialize configuration manager."""
+        if getattr(self, "_initialized", False):
+            return
+        self._initialized = True
         self.config_file = config_file or os.getenv("TOKEN_CONFIG_FILE", "token_config.json")
         self.config = self._load_config()
     
@@ -101,13 +212,9 @@ class ConfigManager:
         config_dict = self._get_default_config()
         
         # Override with config file if it exists
-        if os.path.exists(self.config_file):
-            try:
-                with open(self.config_file, 'r') as f:
-                    file_config = json.load(f)
-                config_dict = self._merge_config(config_dict, file_config)
-            except Exception as e:
-                print(f"Warning: Could not load config file {self.config_file}: {e}")
+        file_config = self._read_config_file()
+        if file_config is not None:
+            config_dict = self._merge_config(config_dict, file_config)
         
         # Override with environment variables
         env_config = self._load_from_env()
@@ -128,54 +235,47 @@ class ConfigManager:
             govinfo_api_key=config_dict["govinfo_api_key"]
         )
     
+    def reload(self) -> TokenManagementConfig:
+        """
+        Re-read environment variables and the config file into self.config.
+        
+        The file is only re-parsed if its mtime or size changed since the
+        last read, so long-running servers can call this periodically.
+        """
+        self.config = self._load_config()
+        return self.config
+    
+    def _read_config_file(self) -> Optional[Dict[str, Any]]:
+        """Read and parse the config file, reusing the last parse if it is unchanged."""
+        try:
+            st = os.stat(self.config_file)
+        except FileNotFoundError:
+            return None
+        
+        cached = _FILE_CACHE.get(self.config_file)
+        if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            return copy.deepcopy(cached[2])
+        
+        try:
+            with open(self.config_file, 'r') as f:
+                file_config = json.load(f)
+        except Exception as e:
+            print(f"Warning: Could not load config file {self.config_file}: {e}")
+            return None
+        
+        _FILE_CACHE[self.config_file] = (st.st_mtime_ns, st.st_size, file_config)
+        return copy.deepcopy(file_config)
+    
     def _get_default_config(self) -> Dict[str, Any]:
         """Get default configuration."""
-        return {
-            "database": {
-                "path": "tokens.db",
-                "backup_enabled": True,
-                "backup_interval_hours": 24,
-                "cleanup_days": 30
-            },
-            "security": {
-                "secret_key": None,
-                "token_prefix": "enact_",
-                "token_length": 32,
-                "hash_algorithm": "sha256",
-                "require_https": False
-            },
-            "rate_limiting": {
-                "default_rate_limit": 1000,
-                "window_hours": 1,
-                "burst_allowance": 50
-            },
-            "logging": {
-                "enabled": True,
-                "log_level": "INFO",
-                "log_file": None,
-                "max_log_size_mb": 100,
-                "backup_count": 5
-            },
-            "analytics": {
-                "enabled": True,
-                "retention_days": 90,
-                "aggregation_interval_minutes": 15,
-                "dashboard_enabled": True,
-                "dashboard_port": 8083
-            },
-            "alerts": {
-                "enabled": True,
-                "high_usage_threshold": 1000,
-                "error_rate_threshold": 0.1,
-                "unused_token_days": 30,
-                "notification_email": None
-            },
-            "server_port": 8082,
-            "server_host": "0.0.0.0",
-            "debug": False,
-            "congress_api_key": "",
-            "govinfo_api_key": ""
-        }
+        return asdict(TokenManagementConfig(
+            database=DatabaseConfig(),
+            security=SecurityConfig(),
+            rate_limiting=RateLimitConfig(),
+            logging=LoggingConfig(),
+            analytics=AnalyticsConfig(),
+            alerts=AlertsConfig()
+        ))
     
     def _load_from_env(self) -> Dict[str, Any]:
         """Load configuration from environment variables."""
@@ -188,61 +288,24 @@ class ConfigManager:
             "alerts": {}
         }
         
-        # Database configuration
-        if os.getenv("TOKEN_DB_PATH"):
-            env_config["database"]["path"] = os.getenv("TOKEN_DB_PATH")
-        if os.getenv("TOKEN_DB_BACKUP_ENABLED"):
-            env_config["database"]["backup_enabled"] = os.getenv("TOKEN_DB_BACKUP_ENABLED").lower() == "true"
-        if os.getenv("TOKEN_DB_CLEANUP_DAYS"):
-            env_config["database"]["cleanup_days"] = int(os.getenv("TOKEN_DB_CLEANUP_DAYS"))
-        
-        # Security configuration
-        if os.getenv("TOKEN_SECRET_KEY"):
-            env_config["security"]["secret_key"] = os.getenv("TOKEN_SECRET_KEY")
-        if os.getenv("TOKEN_PREFIX"):
-            env_config["security"]["token_prefix"] = os.getenv("TOKEN_PREFIX")
-        if os.getenv("TOKEN_LENGTH"):
-            env_config["security"]["token_length"] = int(os.getenv("TOKEN_LENGTH"))
-        if os.getenv("REQUIRE_HTTPS"):
-            env_config["security"]["require_https"] = os.getenv("REQUIRE_HTTPS").lower() == "true"
-        
-        # Rate limiting configuration
-        if os.getenv("DEFAULT_RATE_LIMIT"):
-            env_config["rate_limiting"]["default_rate_limit"] = int(os.getenv("DEFAULT_RATE_LIMIT"))
-        if os.getenv("RATE_LIMIT_WINDOW_HOURS"):
-            env_config["rate_limiting"]["window_hours"] = int(os.getenv("RATE_LIMIT_WINDOW_HOURS"))
-        
-        # Analytics configuration
-        if os.getenv("ANALYTICS_ENABLED"):
-            env_config["analytics"]["enabled"] = os.getenv("ANALYTICS_ENABLED").lower() == "true"
-        if os.getenv("ANALYTICS_RETENTION_DAYS"):
-            env_config["analytics"]["retention_days"] = int(os.getenv("ANALYTICS_RETENTION_DAYS"))
-        if os.getenv("DASHBOARD_PORT"):
-            env_config["analytics"]["dashboard_port"] = int(os.getenv("DASHBOARD_PORT"))
-        
-        # Server configuration
-        if os.getenv("PORT"):
-            env_config["server_port"] = int(os.getenv("PORT"))
-        if os.getenv("HOST"):
-            env_config["server_host"] = os.getenv("HOST")
-        if os.getenv("DEBUG"):
-            env_config["debug"] = os.getenv("DEBUG").lower() == "true"
-        
-        # API keys
-        if os.getenv("CONGRESS_GOV_API_KEY"):
-            env_config["congress_api_key"] = os.getenv("CONGRESS_GOV_API_KEY")
-        if os.getenv("GOVINFO_API_KEY"):
-            env_config["govinfo_api_key"] = os.getenv("GOVINFO_API_KEY")
+        env = os.environ
+        for env_key, section, field, cast in _ENV_SPEC:
+            value = env.get(env_key)
+            if not value:
+                continue
+            target = env_config[section] if section else env_config
+            target[field] = cast(value)
         
         return env_config
     
     def _merge_config(self, base: Dict[str, Any], override: Dict[str, Any]) -> Dict[str, Any]:
-        """Merge configuration dictionaries."""
-        result = base.copy()
+        """Merge configuration dictionaries (sections are one level deep)."""
+        result = {k: (v.copy() if isinstance(v, dict) else v) for k, v in base.items()}
         
         for key, value in override.items():
-            if key in result and isinstance(result[key], dict) and isinstance(value, dict):
-                result[key] = self._merge_config(result[key], value)
+            section = result.get(key)
+            if isinstance(value, dict) and isinstance(section, dict):
+                section.update(value)
             else:
                 result[key] = value
         
@@ -252,96 +315,50 @@ class ConfigManager:
         """Save current configuration to file."""
         file_path = config_file or self.config_file
         
-        config_dict = {
-            "database": {
-                "path": self.config.database.path,
-                "backup_enabled": self.config.database.backup_enabled,
-                "backup_interval_hours": self.config.database.backup_interval_hours,
-                "cleanup_days": self.config.database.cleanup_days
-            },
-            "security": {
-                "secret_key": self.config.security.secret_key,
-                "token_prefix": self.config.security.token_prefix,
-                "token_length": self.config.security.token_length,
-                "hash_algorithm": self.config.security.hash_algorithm,
-                "require_https": self.config.security.require_https
-            },
-            "rate_limiting": {
-                "default_rate_limit": self.config.rate_limiting.default_rate_limit,
-                "window_hours": self.config.rate_limiting.window_hours,
-                "burst_allowance": self.config.rate_limiting.burst_allowance
-            },
-            "logging": {
-                "enabled": self.config.logging.enabled,
-                "log_level": self.config.logging.log_level,
-                "log_file": self.config.logging.log_file,
-                "max_log_size_mb": self.config.logging.max_log_size_mb,
-                "backup_count": self.config.logging.backup_count
-            },
-            "analytics": {
-                "enabled": self.config.analytics.enabled,
-                "retention_days": self.config.analytics.retention_days,
-                "aggregation_interval_minutes": self.config.analytics.aggregation_interval_minutes,
-                "dashboard_enabled": self.config.analytics.dashboard_enabled,
-                "dashboard_port": self.config.analytics.dashboard_port
-            },
-            "alerts": {
-                "enabled": self.config.alerts.enabled,
-                "high_usage_threshold": self.config.alerts.high_usage_threshold,
-                "error_rate_threshold": self.config.alerts.error_rate_threshold,
-                "unused_token_days": self.config.alerts.unused_token_days,
-                "notification_email": self.config.alerts.notification_email
-            },
-            "server_port": self.config.server_port,
-            "server_host": self.config.server_host,
-            "debug": self.config.debug,
-            "congress_api_key": self.config.congress_api_key,
-            "govinfo_api_key": self.config.govinfo_api_key
-        }
+        config_dict = asdict(self.config)
         
+        tmp_path = None
         try:
             # Create directory if it doesn't exist
-            Path(file_path).parent.mkdir(parents=True, exist_ok=True)
+            directory = Path(file_path).parent
+            directory.mkdir(parents=True, exist_ok=True)
+            
+            if orjson is not None:
+                data = orjson.dumps(config_dict, option=orjson.OPT_INDENT_2)
+            else:
+                data = json.dumps(config_dict, indent=2).encode('utf-8')
             
-            with open(file_path, 'w') as f:
-                json.dump(config_dict, f, indent=2)
+            # Write a uniquely named file alongside the target and swap it in
+            # atomically, so concurrent saves never share a temp file
+            with tempfile.NamedTemporaryFile(dir=directory, prefix=".config-",
+                                             suffix=".tmp", delete=False) as f:
+                tmp_path = f.name
+                f.write(data)
+            os.replace(tmp_path, file_path)
+            tmp_path = None
             
             print(f"Configuration saved to {file_path}")
         except Exception as e:
             print(f"Error saving configuration: {e}")
+        finally:
+            if tmp_path is not None:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
     
     def validate_config(self) -> List[str]:
         """Validate configuration and return list of issues."""
-        issues = []
-        
-        # Check required API keys
-        if not self.config.congress_api_key:
-            issues.append("CONGRESS_GOV_API_KEY is not set")
-        
-        # Check database path is writable
-        db_dir = Path(self.config.database.path).parent
-        if not db_dir.exists():
-            try:
-                db_dir.mkdir(parents=True, exist_ok=True)
-            except Exception:
-                issues.append(f"Cannot create database directory: {db_dir}")
-        
-        # Check port availability
-        if not (1 <= self.config.server_port <= 65535):
-            issues.append(f"Invalid server port: {self.config.server_port}")
-        
-        if not (1 <= self.config.analytics.dashboard_port <= 65535):
-            issues.append(f"Invalid dashboard port: {self.config.analytics.dashboard_port}")
-        
-        # Check rate limiting values
-        if self.config.rate_limiting.default_rate_limit < 1:
-            issues.append("Default rate limit must be at least 1")
-        
-        # Check analytics retention
-        if self.config.analytics.retention_days < 1:
-            issues.append("Analytics retention days must be at least 1")
-        
-        return issues
+        config = self.config
+        return list(_validate(
+            config.database.path,
+            config.server_port,
+            config.analytics.dashboard_port,
+            config.rate_limiting.default_rate_limit,
+            config.analytics.retention_days,
+            bool(config.congress_api_key),
+            config.rate_limiting.backend
+        ))
     
     def print_config(self):
         """Print current configuration (masking sensitive values)."""
@@ -349,7 +366,7 @@ class ConfigManager:
         print(f"  Database: {self.config.database.path}")
         print(f"  Server: {self.config.server_host}:{self.config.server_port}")
         print(f"  Dashboard: Port {self.config.analytics.dashboard_port}")
-        print(f"  Rate Limit: {self.config.rate_limiting.default_rate_limit} req/hour")
+        print(f"  Rate Limit: {self.config.rate_limiting.default_rate_limit} req/hour ({self.config.rate_limiting.backend})")
         print(f"  Analytics: {'Enabled' if self.config.analytics.enabled else 'Disabled'}")
         print(f"  Debug: {'Enabled' if self.config.debug else 'Disabled'}")
         
@@ -359,22 +376,23 @@ class ConfigManager:
             print("  Congress API Key: Not set")
 
 
-# Global configuration instance
-_config_manager = None
-
 def get_config() -> TokenManagementConfig:
     """Get the global configuration instance."""
-    global _config_manager
-    if _config_manager is None:
-        _config_manager = ConfigManager()
-    return _config_manager.config
+    return ConfigManager().config
 
 def get_config_manager() -> ConfigManager:
     """Get the global configuration manager instance."""
-    global _config_manager
-    if _config_manager is None:
-        _config_manager = ConfigManager()
-    return _config_manager
+    return ConfigManager()
+
+def reload_config() -> TokenManagementConfig:
+    """Reload the global configuration from the environment and config file."""
+    return ConfigManager().reload()
+
+def __getattr__(name: str):
+    """Build the global configuration lazily on first access to CONFIG."""
+    if name == "CONFIG":
+        return ConfigManager().config
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 # Configuration validation script
@@ -5,25 +5,74 @@ Handles creation, validation, and management of API tokens
 """
 
 import os
+import sys
 import json
 import sqlite3
 import hashlib
 import secrets
+import base64
 from datetime import datetime, timedelta, timezone
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 from dataclasses import dataclass, asdict
 import hmac
+import threading
+import time
+import atexit
+import collections
 
 # Database path
 TOKEN_DB_PATH = os.path.join(os.path.dirname(__file__), "tokens.db")
 SECRET_KEY = os.getenv("TOKEN_SECRET_KEY", secrets.token_hex(32))
 
+# Public token columns, in the order they are selected (token_hash is never exposed)
+TOKEN_COLUMNS = ('id', 'name', 'created_at', 'last_used', 'expires_at',
+                 'permissions', 'active', 'usage_count')
+_TOKEN_SELECT = ", ".join(TOKEN_COLUMNS)
+# Descriptive and revocation columns, returned alongside TOKEN_COLUMNS by get_token_info
+TOKEN_INFO_COLUMNS = TOKEN_COLUMNS + ('description', 'rate_limit', 'allowed_tools',
+                                      'ip_whitelist', 'revoked_at', 'revoked_by',
+                                      'revoked_reason')
+_TOKEN_INFO_SELECT = ", ".join(TOKEN_INFO_COLUMNS)
+
+# Columns added after the tokens table was first released; older databases
+# get them via ALTER TABLE
+_ADDED_COLUMNS = (
+    ("expires_at_epoch", "INTEGER"),
+    ("description", "TEXT"),
+    ("rate_limit", "INTEGER DEFAULT 1000"),
+    ("allowed_tools", "TEXT"),
+    ("ip_whitelist", "TEXT"),
+    ("revoked_at", "TEXT"),
+    ("revoked_by", "TEXT"),
+    ("revoked_reason", "TEXT"),
+)
+
+# Shared string objects for the known permission levels, so hydrated rows
+# don't each carry their own copy
+_PERMISSIONS = {p: sys.intern(p) for p in ("read_only", "standard", "admin")}
+
+# UPDATE ... RETURNING needs SQLite 3.35+
+_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+# Validated tokens are served from memory for this many seconds; at most
+# VALIDATION_CACHE_SIZE tokens are kept, least recently used evicted first
+VALIDATION_CACHE_TTL = 30
+VALIDATION_CACHE_SIZE = 1024
+# Deferred last_used/usage_count updates are written once this many accumulate,
+# or when this many seconds have passed since the last write
+USAGE_FLUSH_THRESHOLD = 100
+USAGE_FLUSH_INTERVAL = 5.0
+# Usage records are queued and inserted by a background thread in batches
+# of up to USAGE_BATCH_SIZE rows, at least every USAGE_RECORD_INTERVAL seconds
+USAGE_BATCH_SIZE = 500
+USAGE_RECORD_INTERVAL = 1.0
+
 @dataclass
 class Token:
     """Token data structure"""
     id: str
     name: str
-    token_hash: str
+    token_hash: bytes
     created_at: str
     last_used: Optional[str] = None
     expires_at: Optional[str] = None
@@ -31,36 +80,94 @@ class Token:
     active: bool = True
     usage_count: int = 0
     
+def _encode_list(values: Optional[Iterable[str]]) -> Optional[str]:
+    """Store a list column as JSON; None or empty means unrestricted"""
+    values = list(values or ())
+    return json.dumps(values) if values else None
+
+def _row_to_dict(row) -> Dict:
+    """Build a token dict from a tuple or sqlite3.Row selected in TOKEN_COLUMNS order"""
+    token_dict = dict(row) if isinstance(row, sqlite3.Row) else dict(zip(TOKEN_COLUMNS, row))
+    token_dict['permissions'] = _PERMISSIONS.get(row[5], row[5])
+    return token_dict
+
 class TokenManager:
     """Manages API tokens for the MCP server"""
     
+    # Database paths whose schema has already been created in this process
+    _schema_inited = set()
+    _schema_lock = threading.Lock()
+    
     def __init__(self, db_path: str = TOKEN_DB_PATH):
         self.db_path = db_path
         self.secret_key = SECRET_KEY
-        self._init_db()
+        # Keyed HMAC state, copied per hash instead of re-deriving the key pads
+        self._hmac_proto = hmac.new(self.secret_key.encode(), b"", hashlib.sha256)
+        self._local = threading.local()
+        
+        # token_hash -> (cached_at, token_data, expires_at_epoch), in LRU order
+        self._val_cache: "collections.OrderedDict[bytes, Tuple[float, Dict, Optional[int]]]" = collections.OrderedDict()
+        self._val_lock = threading.Lock()
+        # token_id -> (last_used, pending usage_count increment)
+        self._usage_pending: Dict[str, Tuple[str, int]] = {}
+        self._pending_count = 0
+        self._pending_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        
+        # Queued token_usage rows, drained by a background thread
+        self._usage_queue = collections.deque()
+        self._flush_lock = threading.Lock()
+        self._flush_event = threading.Event()
+        self._flush_thread = None
+        atexit.register(self.flush)
+        
+        # CREATE ... IF NOT EXISTS is idempotent, so once per path is enough
+        with TokenManager._schema_lock:
+            if self.db_path not in TokenManager._schema_inited:
+                self._init_db()
+                TokenManager._schema_inited.add(self.db_path)
+    
+    def _conn(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening and tuning it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            self._local.conn = conn
+        return conn
     
     def _init_db(self):
         """Initialize the token database"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._conn()
         cursor = conn.cursor()
         
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS tokens (
                 id TEXT PRIMARY KEY,
                 name TEXT NOT NULL,
-                token_hash TEXT NOT NULL UNIQUE,
+                token_hash BLOB NOT NULL UNIQUE,
                 created_at TEXT NOT NULL,
                 last_used TEXT,
                 expires_at TEXT,
+                expires_at_epoch INTEGER,
                 permissions TEXT DEFAULT 'standard',
                 active BOOLEAN DEFAULT 1,
-                usage_count INTEGER DEFAULT 0
+                usage_count INTEGER DEFAULT 0,
+                description TEXT,
+                rate_limit INTEGER DEFAULT 1000,
+                allowed_tools TEXT,
+                ip_whitelist TEXT,
+                revoked_at TEXT,
+                revoked_by TEXT,
+                revoked_reason TEXT
             )
         """)
         
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS token_usage (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                id INTEGER PRIMARY KEY,
                 token_id TEXT NOT NULL,
                 timestamp TEXT NOT NULL,
                 endpoint TEXT,
@@ -70,19 +177,46 @@ class TokenManager:
             )
         """)
         
+        # Databases created before these columns existed: add them, and
+        # backfill expires_at_epoch
+        for column, decl in _ADDED_COLUMNS:
+            try:
+                cursor.execute(f"ALTER TABLE tokens ADD COLUMN {column} {decl}")
+            except sqlite3.OperationalError:
+                pass
+        cursor.execute("""
+            UPDATE tokens SET expires_at_epoch = CAST(strftime('%s', expires_at) AS INTEGER)
+            WHERE expires_at IS NOT NULL AND expires_at_epoch IS NULL
+        """)
+        
+        # token_hash lookups already use the UNIQUE constraint's index
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_usage_token_ts ON token_usage(token_id, timestamp)"
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_tokens_active_expires ON tokens(active, expires_at)"
+        )
+        
         conn.commit()
-        conn.close()
     
-    def _hash_token(self, token: str) -> str:
-        """Generate HMAC-SHA256 hash of token"""
-        return hmac.new(
-            self.secret_key.encode(),
-            token.encode(),
-            hashlib.sha256
-        ).hexdigest()
+    def _hash_token(self, token: str) -> bytes:
+        """Generate HMAC-SHA256 hash of token (raw 32-byte digest)"""
+        h = self._hmac_proto.copy()
+        h.update(token.encode())
+        return h.digest()
+    
+    def _new_token(self) -> Tuple[str, str, bytes]:
+        """Generate a token and return (token_id, token, token_hash)"""
+        # One draw: 8 bytes for the id, 32 for the token body
+        raw = secrets.token_bytes(40)
+        token_id = raw[:8].hex()
+        token = "enact_" + base64.urlsafe_b64encode(raw[8:]).rstrip(b"=").decode("ascii")
+        return token_id, token, self._hash_token(token)
     
     def create_token(self, name: str, permissions: str = "standard", 
-                    expires_days: Optional[int] = None) -> Tuple[str, str]:
+                    expires_days: Optional[int] = None, description: str = "",
+                    rate_limit: int = 1000, allowed_tools: Optional[Iterable[str]] = None,
+                    ip_whitelist: Optional[Iterable[str]] = None) -> Tuple[str, str]:
         """
         Create a new API token
         
@@ -90,29 +224,33 @@ class TokenManager:
             name: Descriptive name for the token
             permissions: Permission level (read_only, standard, admin)
             expires_days: Days until expiration (None = never expires)
+            description: Free-form description
+            rate_limit: Requests allowed per hour
+            allowed_tools: Tools the token may call (None = all tools)
+            ip_whitelist: IPs/CIDR blocks the token may be used from (None = any)
         
         Returns:
             Tuple of (token_id, actual_token)
         """
-        token_id = secrets.token_hex(8)
-        token = f"enact_{secrets.token_urlsafe(32)}"
-        token_hash = self._hash_token(token)
+        token_id, token, token_hash = self._new_token()
         
-        created_at = datetime.now(timezone.utc).isoformat()
-        expires_at = None
+        now = datetime.now(timezone.utc)
+        created_at = now.isoformat()
+        expires_at = expires_at_epoch = None
         if expires_days:
-            expires_at = (datetime.now(timezone.utc) + timedelta(days=expires_days)).isoformat()
-        
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            INSERT INTO tokens (id, name, token_hash, created_at, expires_at, permissions)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (token_id, name, token_hash, created_at, expires_at, permissions))
-        
-        conn.commit()
-        conn.close()
+            expires = now + timedelta(days=expires_days)
+            expires_at = expires.isoformat()
+            expires_at_epoch = int(expires.timestamp())
+        
+        with self._conn() as conn:
+            conn.execute("""
+                INSERT INTO tokens (id, name, token_hash, created_at, expires_at,
+                                    expires_at_epoch, permissions, description,
+                                    rate_limit, allowed_tools, ip_whitelist)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (token_id, name, token_hash, created_at, expires_at,
+                  expires_at_epoch, permissions, description, rate_limit,
+                  _encode_list(allowed_tools), _encode_list(ip_whitelist)))
         
         return token_id, token
     
@@ -127,120 +265,353 @@ class TokenManager:
             Token details if valid, None otherwise
         """
         token_hash = self._hash_token(token)
+        now = time.time()
+        now_iso = datetime.fromtimestamp(now, timezone.utc).isoformat()
+        
+        with self._val_lock:
+            cached = self._val_cache.get(token_hash)
+            if cached and time.monotonic() - cached[0] < VALIDATION_CACHE_TTL:
+                token_data, expires_epoch = cached[1], cached[2]
+                
+                # Check expiration (cached tokens can expire while cached)
+                if expires_epoch is not None and now >= expires_epoch:
+                    return None
+                
+                # Count this use in the cached row too, so successive hits
+                # report the usage_count the database is heading for
+                self._val_cache.move_to_end(token_hash)
+                token_data['last_used'] = now_iso
+                token_data['usage_count'] += 1
+                result = dict(token_data)
+            else:
+                result = None
+        
+        if result is not None:
+            # Update last used and usage count (written in batches)
+            self._queue_usage_update(result['id'], now_iso)
+            return result
+        
+        row = self._touch_token(token_hash, now_iso, int(now))
+        
+        with self._val_lock:
+            if not row:
+                self._val_cache.pop(token_hash, None)
+                return None
+            
+            token_data = _row_to_dict(row[:-1])
+            self._val_cache[token_hash] = (time.monotonic(), token_data, row[-1])
+            self._val_cache.move_to_end(token_hash)
+            if len(self._val_cache) > VALIDATION_CACHE_SIZE:
+                self._val_cache.popitem(last=False)
+            return dict(token_data)
+    
+    def _touch_token(self, token_hash: bytes, now_iso: str, now_epoch: int) -> Optional[tuple]:
+        """
+        Mark an active, unexpired token as used and return its row
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        Expiration is checked in SQL against expires_at_epoch. The returned row
+        is TOKEN_COLUMNS followed by expires_at_epoch.
         
-        cursor.execute("""
-            SELECT id, name, created_at, last_used, expires_at, permissions, active, usage_count
+        Hashes are stored as raw digests; rows written before that hold the
+        hex form. The digest is matched first, and only on a miss is the hex
+        form looked up and that one row rewritten to the digest.
+        """
+        conn = self._conn()
+        
+        if _HAS_RETURNING:
+            with conn:
+                row = conn.execute(f"""
+                    UPDATE tokens 
+                    SET last_used = ?, usage_count = usage_count + 1
+                    WHERE token_hash = ? AND active = 1
+                      AND (expires_at_epoch IS NULL OR expires_at_epoch > ?)
+                    RETURNING {_TOKEN_SELECT}, expires_at_epoch
+                """, (now_iso, token_hash, now_epoch)).fetchone()
+                if row is None:
+                    row = conn.execute(f"""
+                        UPDATE tokens 
+                        SET last_used = ?, usage_count = usage_count + 1, token_hash = ?
+                        WHERE token_hash = ? AND active = 1
+                          AND (expires_at_epoch IS NULL OR expires_at_epoch > ?)
+                        RETURNING {_TOKEN_SELECT}, expires_at_epoch
+                    """, (now_iso, token_hash, token_hash.hex(), now_epoch)).fetchone()
+                return row
+        
+        # SQLite < 3.35: separate lookup and update
+        lookup = f"""
+            SELECT {_TOKEN_SELECT}, expires_at_epoch
             FROM tokens
             WHERE token_hash = ? AND active = 1
-        """, (token_hash,))
-        
-        row = cursor.fetchone()
-        
-        if not row:
-            conn.close()
-            return None
-        
-        token_data = {
-            'id': row[0],
-            'name': row[1],
-            'created_at': row[2],
-            'last_used': row[3],
-            'expires_at': row[4],
-            'permissions': row[5],
-            'active': row[6],
-            'usage_count': row[7]
-        }
-        
-        # Check expiration
-        if token_data['expires_at']:
-            expires = datetime.fromisoformat(token_data['expires_at'])
-            if datetime.now(timezone.utc) > expires:
-                conn.close()
-                return None
-        
-        # Update last used and usage count
-        cursor.execute("""
-            UPDATE tokens 
-            SET last_used = ?, usage_count = usage_count + 1
-            WHERE id = ?
-        """, (datetime.now(timezone.utc).isoformat(), token_data['id']))
-        
-        conn.commit()
-        conn.close()
-        
-        return token_data
+              AND (expires_at_epoch IS NULL OR expires_at_epoch > ?)
+        """
+        row = conn.execute(lookup, (token_hash, now_epoch)).fetchone()
+        legacy = row is None
+        if legacy:
+            row = conn.execute(lookup, (token_hash.hex(), now_epoch)).fetchone()
+        
+        if row:
+            with conn:
+                if legacy:
+                    conn.execute("""
+                        UPDATE tokens 
+                        SET last_used = ?, usage_count = usage_count + 1, token_hash = ?
+                        WHERE id = ?
+                    """, (now_iso, token_hash, row[0]))
+                else:
+                    conn.execute("""
+                        UPDATE tokens 
+                        SET last_used = ?, usage_count = usage_count + 1
+                        WHERE id = ?
+                    """, (now_iso, row[0]))
+            # Report post-update values, matching RETURNING
+            row = row[:3] + (now_iso,) + row[4:7] + (row[7] + 1,) + row[8:]
+        
+        return row
+    
+    def _queue_usage_update(self, token_id: str, last_used: str):
+        """Accumulate a last_used/usage_count update, flushing when enough are pending"""
+        with self._pending_lock:
+            pending = self._usage_pending.get(token_id)
+            count = pending[1] + 1 if pending else 1
+            self._usage_pending[token_id] = (last_used, count)
+            self._pending_count += 1
+            due = (self._pending_count >= USAGE_FLUSH_THRESHOLD
+                   or time.monotonic() - self._last_flush >= USAGE_FLUSH_INTERVAL)
+        
+        if due:
+            self.flush_usage_updates()
+        elif self._flush_thread is None:
+            # The background thread writes these once USAGE_FLUSH_INTERVAL
+            # passes, even if no further validation arrives
+            self._start_flush_thread()
+    
+    def flush_usage_updates(self):
+        """Write all pending last_used/usage_count updates in one statement"""
+        with self._pending_lock:
+            pending, self._usage_pending = self._usage_pending, {}
+            self._pending_count = 0
+            self._last_flush = time.monotonic()
+        
+        if not pending:
+            return
+        
+        with self._conn() as conn:
+            conn.executemany("""
+                UPDATE tokens 
+                SET last_used = ?, usage_count = usage_count + ?
+                WHERE id = ?
+            """, [(last_used, count, token_id)
+                  for token_id, (last_used, count) in pending.items()])
+    
+    def _invalidate_cached_token(self, token_id: str):
+        """Drop cached validation results for a token"""
+        with self._val_lock:
+            for token_hash, (_, token_data, _) in list(self._val_cache.items()):
+                if token_data['id'] == token_id:
+                    del self._val_cache[token_hash]
     
     def record_usage(self, token_id: str, endpoint: str, 
-                    ip_address: str = None, status_code: int = 200):
-        """Record token usage for analytics"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+                    ip_address: str = None, status_code: int = 200,
+                    ts: Optional[str] = None):
+        """Record token usage for analytics (queued and written in batches)
         
-        cursor.execute("""
-            INSERT INTO token_usage (token_id, timestamp, endpoint, ip_address, status_code)
-            VALUES (?, ?, ?, ?, ?)
-        """, (token_id, datetime.now(timezone.utc).isoformat(), endpoint, ip_address, status_code))
+        Pass ts (an ISO timestamp) to reuse one already computed for this request.
+        """
+        self._usage_queue.append(
+            (token_id, ts or datetime.now(timezone.utc).isoformat(), endpoint, ip_address, status_code)
+        )
         
-        conn.commit()
-        conn.close()
+        if self._flush_thread is None:
+            self._start_flush_thread()
+        if len(self._usage_queue) >= USAGE_BATCH_SIZE:
+            self._flush_event.set()
     
-    def revoke_token(self, token_id: str) -> bool:
-        """Revoke a token by ID"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def _start_flush_thread(self):
+        """Start the background thread that drains the usage queue"""
+        with self._flush_lock:
+            if self._flush_thread is None:
+                self._flush_thread = threading.Thread(target=self._flush_loop, daemon=True)
+                self._flush_thread.start()
+    
+    def _flush_loop(self):
+        """Periodically write queued usage records and overdue counter updates"""
+        while True:
+            self._flush_event.wait(USAGE_RECORD_INTERVAL)
+            self._flush_event.clear()
+            try:
+                self._flush_usage_queue()
+                if (self._usage_pending
+                        and time.monotonic() - self._last_flush >= USAGE_FLUSH_INTERVAL):
+                    self.flush_usage_updates()
+            except sqlite3.Error as e:
+                print(f"Error writing usage records: {e}", file=sys.stderr)
+    
+    def _flush_usage_queue(self):
+        """Insert queued usage records, one transaction per batch"""
+        queue = self._usage_queue
+        with self._flush_lock:
+            while queue:
+                batch = []
+                while queue and len(batch) < USAGE_BATCH_SIZE:
+                    batch.append(queue.popleft())
+                
+                with self._conn() as conn:
+                    conn.executemany("""
+                        INSERT INTO token_usage (token_id, timestamp, endpoint, ip_address, status_code)
+                        VALUES (?, ?, ?, ?, ?)
+                    """, batch)
+    
+    def flush(self):
+        """Write all queued usage records and pending usage-counter updates"""
+        self._flush_usage_queue()
+        self.flush_usage_updates()
+    
+    def revoke_token(self, token_id: str, revoked_by: Optional[str] = None,
+                     reason: Optional[str] = None) -> bool:
+        """Revoke a token by ID, recording when, by whom and why"""
+        with self._conn() as conn:
+            cursor = conn.execute("""
+                UPDATE tokens 
+                SET active = 0, revoked_at = ?, revoked_by = ?, revoked_reason = ?
+                WHERE id = ?
+            """, (datetime.now(timezone.utc).isoformat(), revoked_by, reason, token_id))
+        
+        self._invalidate_cached_token(token_id)
+        return cursor.rowcount > 0
+    
+    def rotate_token(self, token_id: str,
+                     revoked_by: Optional[str] = None) -> Optional[Tuple[str, str]]:
+        """
+        Replace an active token with a new one carrying the same settings
         
-        cursor.execute("""
-            UPDATE tokens SET active = 0 WHERE id = ?
-        """, (token_id,))
+        The old token is revoked and the new one created in one transaction.
+        The new token keeps the old one's name, permissions, limits and expiry.
         
-        affected = cursor.rowcount
-        conn.commit()
-        conn.close()
+        Returns:
+            Tuple of (new_token_id, actual_token), or None if the token is
+            missing or already inactive
+        """
+        new_id, token, token_hash = self._new_token()
+        now = datetime.now(timezone.utc).isoformat()
         
-        return affected > 0
+        with self._conn() as conn:
+            cursor = conn.execute("""
+                UPDATE tokens 
+                SET active = 0, revoked_at = ?, revoked_by = ?, revoked_reason = ?
+                WHERE id = ? AND active = 1
+            """, (now, revoked_by, f"Rotated to {new_id}", token_id))
+            if cursor.rowcount == 0:
+                return None
+            conn.execute("""
+                INSERT INTO tokens (id, name, token_hash, created_at, expires_at,
+                                    expires_at_epoch, permissions, description,
+                                    rate_limit, allowed_tools, ip_whitelist)
+                SELECT ?, name, ?, ?, expires_at, expires_at_epoch, permissions,
+                       description, rate_limit, allowed_tools, ip_whitelist
+                FROM tokens WHERE id = ?
+            """, (new_id, token_hash, now, token_id))
+        
+        self._invalidate_cached_token(token_id)
+        return new_id, token
     
-    def list_tokens(self, active_only: bool = True) -> List[Dict]:
-        """List all tokens"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def get_token_info(self, identifier: str) -> Optional[Dict]:
+        """
+        Get a token's full details by ID, or by name when no ID matches
         
-        query = "SELECT * FROM tokens"
-        if active_only:
+        Returns None when nothing matches, or a dict with an 'error' key when
+        the name is shared by several tokens.
+        """
+        self.flush_usage_updates()
+        cursor = self._conn().cursor()
+        cursor.row_factory = sqlite3.Row
+        
+        query = f"SELECT {_TOKEN_INFO_SELECT} FROM tokens WHERE "
+        rows = cursor.execute(query + "id = ?", (identifier,)).fetchall()
+        if not rows:
+            rows = cursor.execute(query + "name = ?", (identifier,)).fetchall()
+        
+        if not rows:
+            return None
+        if len(rows) > 1:
+            return {'error': f"{len(rows)} tokens are named '{identifier}'; use the token ID"}
+        
+        token_info = _row_to_dict(rows[0])
+        for key in ('allowed_tools', 'ip_whitelist'):
+            if token_info[key]:
+                token_info[key] = json.loads(token_info[key])
+        return token_info
+    
+    def iter_tokens(self, include_inactive: bool = False) -> Iterator[Dict]:
+        """Yield tokens one at a time without materializing the full list"""
+        self.flush_usage_updates()
+        cursor = self._conn().cursor()
+        cursor.row_factory = sqlite3.Row
+        
+        query = f"SELECT {_TOKEN_SELECT} FROM tokens"
+        if not include_inactive:
             query += " WHERE active = 1"
         query += " ORDER BY created_at DESC"
         
         cursor.execute(query)
-        columns = [col[0] for col in cursor.description]
-        rows = cursor.fetchall()
         
-        tokens = []
-        for row in rows:
-            token_dict = dict(zip(columns, row))
-            # Don't expose the hash
-            token_dict.pop('token_hash', None)
-            tokens.append(token_dict)
+        while True:
+            rows = cursor.fetchmany(500)
+            if not rows:
+                break
+            for row in rows:
+                yield _row_to_dict(row)
+    
+    def list_tokens(self, active_only: bool = True) -> List[Dict]:
+        """List all tokens"""
+        return list(self.iter_tokens(include_inactive=not active_only))
+    
+    def list_tokens_with_stats(self, include_inactive: bool = False, hours: int = 24) -> List[Dict]:
+        """List tokens together with their recent request and error counts"""
+        self.flush()
+        cursor = self._conn().cursor()
+        
+        since = (datetime.now(timezone.utc) - timedelta(hours=hours)).isoformat()
+        
+        # One aggregate over token_usage joined onto tokens, rather than a
+        # separate stats query per token
+        query = """
+            SELECT t.id, t.name, t.created_at, t.last_used, t.expires_at,
+                   t.permissions, t.active, t.usage_count,
+                   COALESCE(u.requests, 0) AS requests,
+                   COALESCE(u.errors, 0) AS errors
+            FROM tokens t
+            LEFT JOIN (
+                SELECT token_id, COUNT(*) AS requests,
+                       SUM(CASE WHEN status_code >= 400 THEN 1 ELSE 0 END) AS errors
+                FROM token_usage
+                WHERE timestamp > ?
+                GROUP BY token_id
+            ) u ON u.token_id = t.id
+        """
+        if not include_inactive:
+            query += " WHERE t.active = 1"
+        query += " ORDER BY t.created_at DESC"
         
-        conn.close()
-        return tokens
+        cursor.row_factory = sqlite3.Row
+        cursor.execute(query, (since,))
+        return [dict(row) for row in cursor]
     
     def get_token_stats(self, token_id: str, days: int = 7) -> Dict:
         """Get usage statistics for a token"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        self.flush()
+        cursor = self._conn().cursor()
         
         since = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
         
         # Get usage count
         cursor.execute("""
-            SELECT COUNT(*), COUNT(DISTINCT endpoint), COUNT(DISTINCT ip_address)
+            SELECT COUNT(*), COALESCE(SUM(CASE WHEN status_code >= 400 THEN 1 ELSE 0 END), 0),
+                   COUNT(DISTINCT endpoint), COUNT(DISTINCT ip_address)
             FROM token_usage
             WHERE token_id = ? AND timestamp > ?
         """, (token_id, since))
         
-        total_requests, unique_endpoints, unique_ips = cursor.fetchone()
+        total_requests, errors, unique_endpoints, unique_ips = cursor.fetchone()
         
         # Get endpoint breakdown
         cursor.execute("""
@@ -254,34 +625,127 @@ class TokenManager:
         
         endpoint_stats = cursor.fetchall()
         
-        conn.close()
-        
         return {
             'token_id': token_id,
             'period_days': days,
             'total_requests': total_requests,
+            'errors': errors,
             'unique_endpoints': unique_endpoints,
             'unique_ips': unique_ips,
             'top_endpoints': [{'endpoint': e[0], 'count': e[1]} for e in endpoint_stats]
         }
     
+    def get_analytics(self, hours: int = 24) -> Dict:
+        """Get token counts and the most active tokens over the last hours"""
+        self.flush()
+        cursor = self._conn().cursor()
+        
+        since = (datetime.now(timezone.utc) - timedelta(hours=hours)).isoformat()
+        
+        cursor.execute("SELECT COUNT(*), COALESCE(SUM(active), 0) FROM tokens")
+        total_tokens, active_tokens = cursor.fetchone()
+        
+        cursor.execute("SELECT COUNT(*) FROM token_usage WHERE timestamp > ?", (since,))
+        total_requests = cursor.fetchone()[0]
+        
+        cursor.execute("""
+            SELECT u.token_id, COALESCE(t.name, u.token_id), COUNT(*) AS requests
+            FROM token_usage u
+            LEFT JOIN tokens t ON t.id = u.token_id
+            WHERE u.timestamp > ?
+            GROUP BY u.token_id
+            ORDER BY requests DESC
+            LIMIT 10
+        """, (since,))
+        
+        return {
+            'period_hours': hours,
+            'total_tokens': total_tokens,
+            'active_tokens': active_tokens,
+            'total_requests': total_requests,
+            'recent_usage': [{'token_id': r[0], 'token_name': r[1], 'requests': r[2]}
+                             for r in cursor.fetchall()]
+        }
+    
     def cleanup_expired(self) -> int:
         """Remove expired tokens"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
         now = datetime.now(timezone.utc).isoformat()
-        cursor.execute("""
-            UPDATE tokens 
-            SET active = 0 
-            WHERE expires_at IS NOT NULL AND expires_at < ? AND active = 1
-        """, (now,))
+        with self._conn() as conn:
+            cursor = conn.execute("""
+                UPDATE tokens 
+                SET active = 0 
+                WHERE expires_at IS NOT NULL AND expires_at < ? AND active = 1
+            """, (now,))
+        
+        with self._val_lock:
+            self._val_cache.clear()
+        return cursor.rowcount
+
+    def cleanup_expired_tokens(self, usage_days: int = 30,
+                               batch_size: int = 1000) -> Tuple[int, int]:
+        """
+        Deactivate expired tokens and purge old usage records
         
-        affected = cursor.rowcount
-        conn.commit()
-        conn.close()
+        Usage records are deleted in chunks of batch_size, each committed
+        separately so other writers are not locked out for the whole purge.
+        
+        Args:
+            usage_days: Usage records older than this many days are deleted
+            batch_size: Maximum usage rows removed per transaction (>= 1)
         
-        return affected
+        Returns:
+            Tuple of (expired_tokens, deleted_usage_records)
+        """
+        if batch_size < 1:
+            raise ValueError(f"batch_size must be at least 1, got {batch_size}")
+        
+        conn = self._conn()
+        cursor = conn.cursor()
+        
+        now = datetime.now(timezone.utc)
+        cutoff = (now - timedelta(days=usage_days)).isoformat()
+        
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            
+            cursor.execute("""
+                UPDATE tokens 
+                SET active = 0 
+                WHERE expires_at IS NOT NULL AND expires_at < ? AND active = 1
+            """, (now.isoformat(),))
+            expired = cursor.rowcount
+            conn.commit()
+            
+            # Delete in bounded chunks, releasing the write lock between them
+            deleted = 0
+            while True:
+                cursor.execute("BEGIN IMMEDIATE")
+                cursor.execute("""
+                    DELETE FROM token_usage WHERE id IN (
+                        SELECT id FROM token_usage WHERE timestamp < ? LIMIT ?
+                    )
+                """, (cutoff, batch_size))
+                conn.commit()
+                deleted += cursor.rowcount
+                if cursor.rowcount < batch_size:
+                    break
+        except Exception:
+            conn.rollback()
+            raise
+        
+        with self._val_lock:
+            self._val_cache.clear()
+        
+        return expired, deleted
+
+_manager: Optional[TokenManager] = None
+
+def get_token_manager() -> TokenManager:
+    """Get the shared TokenManager for the default database, created on first use"""
+    global _manager
+    if _manager is None:
+        _manager = TokenManager()
+    return _manager
 
 # CLI functionality
 if __name__ == "__main__":
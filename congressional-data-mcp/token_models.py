@@ -5,11 +5,82 @@ Defines the data models and database structure for secure token management
 
 import sqlite3
 import json
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any
+import asyncio
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Any, Tuple
 from dataclasses import dataclass, asdict
 from enum import Enum
 import os
+import time
+import queue
+import threading
+import atexit
+from collections import OrderedDict
+from pathlib import Path
+from contextlib import contextmanager
+
+# List columns (allowed_tools, ip_whitelist) are stored joined on the ASCII
+# unit separator; rows written before that hold JSON arrays
+LIST_SEP = "\x1f"
+
+MMAP_SIZE = 256 * 1024 * 1024
+
+# Active tokens kept in memory by get_token_by_hash. Entries expire after
+# TOKEN_CACHE_TTL seconds so revocations made by other processes on the
+# same database take effect promptly.
+TOKEN_CACHE_SIZE = 1024
+TOKEN_CACHE_TTL = 30
+
+# Buffered usage rows are written in one transaction once this many are
+# queued, or every USAGE_FLUSH_INTERVAL seconds
+USAGE_FLUSH_SIZE = 500
+USAGE_FLUSH_INTERVAL = 0.2
+
+# tokens columns in the fixed order rows are selected, inserted and unpacked
+TOKEN_COLUMNS = (
+    'id', 'hashed_token', 'name', 'description', 'permissions', 'rate_limit',
+    'allowed_tools', 'ip_whitelist', 'expires_at', 'created_at', 'last_used_at',
+    'usage_count', 'is_active', 'revoked_at', 'revoked_by', 'revoked_reason'
+)
+_TOKEN_SELECT = ", ".join(TOKEN_COLUMNS)
+
+_INSERT_TOKEN = f"""
+    INSERT INTO tokens ({_TOKEN_SELECT})
+    VALUES ({", ".join("?" * len(TOKEN_COLUMNS))})
+"""
+
+_INSERT_USAGE = """
+    INSERT INTO token_usage (
+        id, token_id, timestamp, tool_name, success, 
+        ip_address, user_agent, response_time_ms, error_message
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def _to_ms(dt: Optional[datetime]) -> Optional[int]:
+    """Encode a datetime as unix epoch milliseconds."""
+    return int(dt.timestamp() * 1000) if dt else None
+
+
+def _from_ms(value) -> Optional[datetime]:
+    """Decode a stored epoch-milliseconds timestamp (int, or digits in older databases)."""
+    return datetime.fromtimestamp(int(value) / 1000) if value is not None else None
+
+
+def _iso_to_ms(value):
+    """Convert an ISO-8601 timestamp to epoch milliseconds, for the schema migration."""
+    if isinstance(value, str) and "-" in value:
+        return _to_ms(datetime.fromisoformat(value))
+    return value
+
+
+def _split_list(value: Optional[str]) -> Optional[List[str]]:
+    """Decode a stored list column."""
+    if not value:
+        return None
+    if value[0] == "[":
+        return json.loads(value)
+    return value.split(LIST_SEP)
 
 
 class TokenPermission(Enum):
@@ -19,6 +90,10 @@ class TokenPermission(Enum):
     ADMIN = "admin"
 
 
+# Plain dict lookup; calling TokenPermission(value) goes through Enum.__call__
+_PERMISSION_BY_VALUE = {p.value: p for p in TokenPermission}
+
+
 @dataclass
 class TokenMetadata:
     """Token metadata structure."""
@@ -66,11 +141,80 @@ class TokenDatabase:
     def __init__(self, db_path: str = "tokens.db"):
         """Initialize the token database."""
         self.db_path = db_path
+        self._memory = db_path == ":memory:"
+        # One long-lived writer, serialized by a lock, plus a pool of
+        # read-only connections (a :memory: database cannot be shared, so
+        # reads there go through the writer)
+        self._write_lock = threading.Lock()
+        self._write_conn = self._connect()
+        self._read_pool: "queue.Queue[sqlite3.Connection]" = queue.Queue(maxsize=os.cpu_count() or 4)
+        # Pending token_usage rows, drained by a background thread
+        self._usage_buffer: List[tuple] = []
+        self._usage_lock = threading.Lock()
+        self._flush_event = threading.Event()
+        self._flush_thread: Optional[threading.Thread] = None
+        # hashed_token -> (monotonic load time, Token), least recently used
+        # first; _cache_ids maps token id -> hashed_token for the same entries
+        self._token_cache: "OrderedDict[str, Tuple[float, Token]]" = OrderedDict()
+        self._cache_ids: Dict[str, str] = {}
+        self._cache_lock = threading.Lock()
         self.init_database()
+        atexit.register(self.flush_usage)
+    
+    def _connect(self, readonly: bool = False) -> sqlite3.Connection:
+        """Open a connection with the per-connection PRAGMAs applied."""
+        if readonly:
+            # as_uri() percent-encodes '?', '#' and '%' in the path
+            uri = Path(self.db_path).resolve().as_uri() + "?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA cache_size=-20000")
+        # Memory-map up to 256 MB (SQLite maps no more than the file size).
+        # On 32-bit platforms address space is tight; lower this there.
+        conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+        return conn
+    
+    @contextmanager
+    def _writer(self):
+        """Borrow the writer connection inside a transaction."""
+        with self._write_lock:
+            with self._write_conn as conn:
+                yield conn
+    
+    @contextmanager
+    def _reader(self):
+        """Borrow a read-only connection from the pool."""
+        if self._memory:
+            with self._writer() as conn:
+                yield conn
+            return
+        
+        try:
+            conn = self._read_pool.get_nowait()
+        except queue.Empty:
+            conn = self._connect(readonly=True)
+        try:
+            yield conn
+        finally:
+            try:
+                self._read_pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
     
     def init_database(self):
         """Initialize the database schema."""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._writer() as conn:
+            # page_size can only be set before the first page is written (and
+            # not at all once in WAL mode), so this only affects new databases
+            if conn.execute("PRAGMA page_count").fetchone()[0] == 0:
+                conn.execute("PRAGMA page_size=8192")
+            # WAL is persistent in the database file; it does not apply to :memory:
+            if not self._memory:
+                conn.execute("PRAGMA journal_mode=WAL")
             conn.executescript("""
                 CREATE TABLE IF NOT EXISTS tokens (
                     id TEXT PRIMARY KEY,
@@ -79,14 +223,14 @@ class TokenDatabase:
                     description TEXT,
                     permissions TEXT NOT NULL,
                     rate_limit INTEGER DEFAULT 1000,
-                    allowed_tools TEXT,  -- JSON array
-                    ip_whitelist TEXT,   -- JSON array
-                    expires_at TEXT,     -- ISO format datetime
-                    created_at TEXT NOT NULL,
-                    last_used_at TEXT,
+                    allowed_tools TEXT,  -- LIST_SEP-joined list
+                    ip_whitelist TEXT,   -- LIST_SEP-joined list
+                    expires_at INTEGER,  -- unix epoch milliseconds
+                    created_at INTEGER NOT NULL,
+                    last_used_at INTEGER,
                     usage_count INTEGER DEFAULT 0,
                     is_active BOOLEAN DEFAULT 1,
-                    revoked_at TEXT,
+                    revoked_at INTEGER,
                     revoked_by TEXT,
                     revoked_reason TEXT
                 );
@@ -94,7 +238,7 @@ class TokenDatabase:
                 CREATE TABLE IF NOT EXISTS token_usage (
                     id TEXT PRIMARY KEY,
                     token_id TEXT NOT NULL,
-                    timestamp TEXT NOT NULL,
+                    timestamp INTEGER NOT NULL,
                     tool_name TEXT NOT NULL,
                     success BOOLEAN NOT NULL,
                     ip_address TEXT,
@@ -104,11 +248,36 @@ class TokenDatabase:
                     FOREIGN KEY (token_id) REFERENCES tokens (id)
                 );
                 
-                CREATE INDEX IF NOT EXISTS idx_tokens_hashed ON tokens(hashed_token);
-                CREATE INDEX IF NOT EXISTS idx_tokens_active ON tokens(is_active);
-                CREATE INDEX IF NOT EXISTS idx_usage_token_id ON token_usage(token_id);
+                -- Requests per token per hour (bucket = unix time // 3600)
+                CREATE TABLE IF NOT EXISTS rate_limits (
+                    token_id TEXT NOT NULL,
+                    bucket INTEGER NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (token_id, bucket)
+                );
+                
+                DROP INDEX IF EXISTS idx_tokens_hashed;
+                DROP INDEX IF EXISTS idx_tokens_active;
+                CREATE INDEX IF NOT EXISTS idx_tokens_active_created ON tokens(created_at) WHERE is_active = 1;
+                DROP INDEX IF EXISTS idx_usage_token_id;
+                CREATE INDEX IF NOT EXISTS idx_usage_token_ts ON token_usage(token_id, timestamp);
                 CREATE INDEX IF NOT EXISTS idx_usage_timestamp ON token_usage(timestamp);
             """)
+            
+            # Version 1: timestamps moved from ISO-8601 text to epoch milliseconds.
+            # Older databases keep their TEXT column affinity, so converted values
+            # are stored as 13-digit strings; those still order and compare correctly
+            # against integer parameters, and _from_ms accepts them.
+            if conn.execute("PRAGMA user_version").fetchone()[0] < 1:
+                conn.create_function("iso_to_ms", 1, _iso_to_ms)
+                conn.execute("""
+                    UPDATE tokens SET created_at = iso_to_ms(created_at),
+                        last_used_at = iso_to_ms(last_used_at),
+                        expires_at = iso_to_ms(expires_at),
+                        revoked_at = iso_to_ms(revoked_at)
+                """)
+                conn.execute("UPDATE token_usage SET timestamp = iso_to_ms(timestamp)")
+                conn.execute("PRAGMA user_version = 1")
     
     def _serialize_metadata(self, metadata: TokenMetadata) -> Dict[str, Any]:
         """Serialize metadata for database storage."""
@@ -117,55 +286,69 @@ class TokenDatabase:
             'description': metadata.description,
             'permissions': metadata.permissions.value,
             'rate_limit': metadata.rate_limit,
-            'allowed_tools': json.dumps(metadata.allowed_tools) if metadata.allowed_tools else None,
-            'ip_whitelist': json.dumps(metadata.ip_whitelist) if metadata.ip_whitelist else None,
-            'expires_at': metadata.expires_at.isoformat() if metadata.expires_at else None
+            'allowed_tools': LIST_SEP.join(metadata.allowed_tools) if metadata.allowed_tools else None,
+            'ip_whitelist': LIST_SEP.join(metadata.ip_whitelist) if metadata.ip_whitelist else None,
+            'expires_at': _to_ms(metadata.expires_at)
         }
         return data
     
-    def _deserialize_metadata(self, row: Dict[str, Any]) -> TokenMetadata:
-        """Deserialize metadata from database row."""
-        return TokenMetadata(
-            name=row['name'],
-            description=row['description'] or "",
-            permissions=TokenPermission(row['permissions']),
-            rate_limit=row['rate_limit'],
-            allowed_tools=json.loads(row['allowed_tools']) if row['allowed_tools'] else None,
-            ip_whitelist=json.loads(row['ip_whitelist']) if row['ip_whitelist'] else None,
-            expires_at=datetime.fromisoformat(row['expires_at']) if row['expires_at'] else None
+    def _row_to_token(self, row: tuple) -> Token:
+        """Build a Token from a row selected in TOKEN_COLUMNS order."""
+        (token_id, hashed_token, name, description, permissions, rate_limit,
+         allowed_tools, ip_whitelist, expires_at, created_at, last_used_at,
+         usage_count, is_active, revoked_at, revoked_by, revoked_reason) = row
+        return Token(
+            id=token_id,
+            hashed_token=hashed_token,
+            metadata=TokenMetadata(
+                name=name,
+                description=description or "",
+                permissions=_PERMISSION_BY_VALUE[permissions],
+                rate_limit=rate_limit,
+                allowed_tools=_split_list(allowed_tools),
+                ip_whitelist=_split_list(ip_whitelist),
+                expires_at=_from_ms(expires_at)
+            ),
+            created_at=_from_ms(created_at),
+            last_used_at=_from_ms(last_used_at),
+            usage_count=usage_count,
+            is_active=bool(is_active),
+            revoked_at=_from_ms(revoked_at),
+            revoked_by=revoked_by,
+            revoked_reason=revoked_reason
+        )
+    
+    def _token_row(self, token: Token) -> tuple:
+        """Serialize a token for insertion."""
+        metadata_dict = self._serialize_metadata(token.metadata)
+        return (
+            token.id,
+            token.hashed_token,
+            metadata_dict['name'],
+            metadata_dict['description'],
+            metadata_dict['permissions'],
+            metadata_dict['rate_limit'],
+            metadata_dict['allowed_tools'],
+            metadata_dict['ip_whitelist'],
+            metadata_dict['expires_at'],
+            _to_ms(token.created_at),
+            _to_ms(token.last_used_at),
+            token.usage_count,
+            token.is_active,
+            _to_ms(token.revoked_at),
+            token.revoked_by,
+            token.revoked_reason
         )
     
     def create_token(self, token: Token) -> bool:
         """Create a new token in the database."""
+        return self.create_tokens([token])
+    
+    def create_tokens(self, tokens: Iterable[Token]) -> bool:
+        """Create several tokens in a single transaction."""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
-                metadata_dict = self._serialize_metadata(token.metadata)
-                
-                conn.execute("""
-                    INSERT INTO tokens (
-                        id, hashed_token, name, description, permissions, rate_limit,
-                        allowed_tools, ip_whitelist, expires_at, created_at, last_used_at,
-                        usage_count, is_active, revoked_at, revoked_by, revoked_reason
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    token.id,
-                    token.hashed_token,
-                    metadata_dict['name'],
-                    metadata_dict['description'],
-                    metadata_dict['permissions'],
-                    metadata_dict['rate_limit'],
-                    metadata_dict['allowed_tools'],
-                    metadata_dict['ip_whitelist'],
-                    metadata_dict['expires_at'],
-                    token.created_at.isoformat(),
-                    token.last_used_at.isoformat() if token.last_used_at else None,
-                    token.usage_count,
-                    token.is_active,
-                    token.revoked_at.isoformat() if token.revoked_at else None,
-                    token.revoked_by,
-                    token.revoked_reason
-                ))
+            with self._writer() as conn:
+                conn.executemany(_INSERT_TOKEN, (self._token_row(t) for t in tokens))
                 return True
         except Exception as e:
             print(f"Error creating token: {e}")
@@ -173,11 +356,20 @@ class TokenDatabase:
     
     def get_token_by_hash(self, hashed_token: str) -> Optional[Token]:
         """Retrieve token by hashed value."""
+        with self._cache_lock:
+            entry = self._token_cache.get(hashed_token)
+            if entry is not None:
+                if time.monotonic() - entry[0] < TOKEN_CACHE_TTL:
+                    self._token_cache.move_to_end(hashed_token)
+                    return entry[1]
+                # Stale: re-read so is_active reflects other processes
+                del self._token_cache[hashed_token]
+                self._cache_ids.pop(entry[1].id, None)
+        
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
+            with self._reader() as conn:
                 cursor = conn.execute(
-                    "SELECT * FROM tokens WHERE hashed_token = ? AND is_active = 1",
+                    f"SELECT {_TOKEN_SELECT} FROM tokens WHERE hashed_token = ? AND is_active = 1",
                     (hashed_token,)
                 )
                 row = cursor.fetchone()
@@ -185,51 +377,44 @@ class TokenDatabase:
                 if not row:
                     return None
                 
-                row_dict = dict(row)
-                metadata = self._deserialize_metadata(row_dict)
-                
-                return Token(
-                    id=row_dict['id'],
-                    hashed_token=row_dict['hashed_token'],
-                    metadata=metadata,
-                    created_at=datetime.fromisoformat(row_dict['created_at']),
-                    last_used_at=datetime.fromisoformat(row_dict['last_used_at']) if row_dict['last_used_at'] else None,
-                    usage_count=row_dict['usage_count'],
-                    is_active=bool(row_dict['is_active']),
-                    revoked_at=datetime.fromisoformat(row_dict['revoked_at']) if row_dict['revoked_at'] else None,
-                    revoked_by=row_dict['revoked_by'],
-                    revoked_reason=row_dict['revoked_reason']
-                )
+                token = self._row_to_token(row)
         except Exception as e:
             print(f"Error retrieving token: {e}")
             return None
+        
+        with self._cache_lock:
+            self._token_cache[hashed_token] = (time.monotonic(), token)
+            self._cache_ids[token.id] = hashed_token
+            if len(self._token_cache) > TOKEN_CACHE_SIZE:
+                evicted_hash, (_, evicted) = self._token_cache.popitem(last=False)
+                if self._cache_ids.get(evicted.id) == evicted_hash:
+                    del self._cache_ids[evicted.id]
+        return token
+    
+    def _invalidate(self, token_id: str):
+        """Drop a token from the lookup cache."""
+        with self._cache_lock:
+            hashed_token = self._cache_ids.pop(token_id, None)
+            if hashed_token is not None:
+                self._token_cache.pop(hashed_token, None)
+    
+    def _cached_token(self, token_id: str) -> Optional[Token]:
+        """Return the cached Token for an ID, if any (caller holds _cache_lock)."""
+        hashed_token = self._cache_ids.get(token_id)
+        entry = self._token_cache.get(hashed_token) if hashed_token else None
+        return entry[1] if entry else None
     
     def get_token_by_id(self, token_id: str) -> Optional[Token]:
         """Retrieve token by ID."""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
-                cursor = conn.execute("SELECT * FROM tokens WHERE id = ?", (token_id,))
+            with self._reader() as conn:
+                cursor = conn.execute(f"SELECT {_TOKEN_SELECT} FROM tokens WHERE id = ?", (token_id,))
                 row = cursor.fetchone()
                 
                 if not row:
                     return None
                 
-                row_dict = dict(row)
-                metadata = self._deserialize_metadata(row_dict)
-                
-                return Token(
-                    id=row_dict['id'],
-                    hashed_token=row_dict['hashed_token'],
-                    metadata=metadata,
-                    created_at=datetime.fromisoformat(row_dict['created_at']),
-                    last_used_at=datetime.fromisoformat(row_dict['last_used_at']) if row_dict['last_used_at'] else None,
-                    usage_count=row_dict['usage_count'],
-                    is_active=bool(row_dict['is_active']),
-                    revoked_at=datetime.fromisoformat(row_dict['revoked_at']) if row_dict['revoked_at'] else None,
-                    revoked_by=row_dict['revoked_by'],
-                    revoked_reason=row_dict['revoked_reason']
-                )
+                return self._row_to_token(row)
         except Exception as e:
             print(f"Error retrieving token by ID: {e}")
             return None
@@ -237,36 +422,16 @@ class TokenDatabase:
     def list_tokens(self, include_inactive: bool = False) -> List[Token]:
         """List all tokens."""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
-                query = "SELECT * FROM tokens"
+            with self._reader() as conn:
+                query = f"SELECT {_TOKEN_SELECT} FROM tokens"
                 if not include_inactive:
                     query += " WHERE is_active = 1"
                 query += " ORDER BY created_at DESC"
                 
-                cursor = conn.execute(query)
-                rows = cursor.fetchall()
-                
-                tokens = []
-                for row in rows:
-                    row_dict = dict(row)
-                    metadata = self._deserialize_metadata(row_dict)
-                    
-                    token = Token(
-                        id=row_dict['id'],
-                        hashed_token=row_dict['hashed_token'],
-                        metadata=metadata,
-                        created_at=datetime.fromisoformat(row_dict['created_at']),
-                        last_used_at=datetime.fromisoformat(row_dict['last_used_at']) if row_dict['last_used_at'] else None,
-                        usage_count=row_dict['usage_count'],
-                        is_active=bool(row_dict['is_active']),
-                        revoked_at=datetime.fromisoformat(row_dict['revoked_at']) if row_dict['revoked_at'] else None,
-                        revoked_by=row_dict['revoked_by'],
-                        revoked_reason=row_dict['revoked_reason']
-                    )
-                    tokens.append(token)
+                rows = conn.execute(query).fetchall()
                 
-                return tokens
+                # Rows are already in TOKEN_COLUMNS order, so they map straight through
+                return list(map(self._row_to_token, rows))
         except Exception as e:
             print(f"Error listing tokens: {e}")
             return []
@@ -274,34 +439,43 @@ class TokenDatabase:
     def update_token_usage(self, token_id: str, last_used_at: datetime, increment_count: bool = True) -> bool:
         """Update token usage information."""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._writer() as conn:
                 if increment_count:
                     conn.execute("""
                         UPDATE tokens 
                         SET last_used_at = ?, usage_count = usage_count + 1 
                         WHERE id = ?
-                    """, (last_used_at.isoformat(), token_id))
+                    """, (_to_ms(last_used_at), token_id))
                 else:
                     conn.execute("""
                         UPDATE tokens 
                         SET last_used_at = ? 
                         WHERE id = ?
-                    """, (last_used_at.isoformat(), token_id))
-                return True
+                    """, (_to_ms(last_used_at), token_id))
         except Exception as e:
             print(f"Error updating token usage: {e}")
             return False
+        
+        # Keep the cached copy current rather than dropping it
+        with self._cache_lock:
+            token = self._cached_token(token_id)
+            if token is not None:
+                token.last_used_at = last_used_at
+                if increment_count:
+                    token.usage_count += 1
+        return True
     
     def revoke_token(self, token_id: str, revoked_by: str, reason: str = "Manual revocation") -> bool:
         """Revoke a token."""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._writer() as conn:
                 conn.execute("""
                     UPDATE tokens 
                     SET is_active = 0, revoked_at = ?, revoked_by = ?, revoked_reason = ?
                     WHERE id = ?
-                """, (datetime.now().isoformat(), revoked_by, reason, token_id))
-                return True
+                """, (int(time.time() * 1000), revoked_by, reason, token_id))
+            self._invalidate(token_id)
+            return True
         except Exception as e:
             print(f"Error revoking token: {e}")
             return False
@@ -309,37 +483,92 @@ class TokenDatabase:
     def reactivate_token(self, token_id: str) -> bool:
         """Reactivate a revoked token."""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._writer() as conn:
                 conn.execute("""
                     UPDATE tokens 
                     SET is_active = 1, revoked_at = NULL, revoked_by = NULL, revoked_reason = NULL
                     WHERE id = ?
                 """, (token_id,))
-                return True
+            self._invalidate(token_id)
+            return True
         except Exception as e:
             print(f"Error reactivating token: {e}")
             return False
     
+    @staticmethod
+    def _usage_row(usage: TokenUsage) -> tuple:
+        """Serialize a usage record for insertion."""
+        return (
+            usage.id,
+            usage.token_id,
+            _to_ms(usage.timestamp),
+            usage.tool_name,
+            usage.success,
+            usage.ip_address,
+            usage.user_agent,
+            usage.response_time_ms,
+            usage.error_message
+        )
+    
     def log_usage(self, usage: TokenUsage) -> bool:
-        """Log token usage."""
+        """Log token usage (buffered and written in batches)."""
+        with self._usage_lock:
+            self._usage_buffer.append(self._usage_row(usage))
+            pending = len(self._usage_buffer)
+        
+        if self._flush_thread is None:
+            self._start_flush_thread()
+        if pending >= USAGE_FLUSH_SIZE:
+            self._flush_event.set()
+        return True
+    
+    async def log_usage_async(self, usage: TokenUsage) -> bool:
+        """Log token usage from a coroutine.
+        
+        log_usage only appends to the in-memory buffer (the SQLite write happens
+        on the flush thread), so this never blocks the event loop.
+        """
+        return self.log_usage(usage)
+    
+    async def flush_usage_async(self) -> bool:
+        """Write buffered usage rows from a coroutine, off the event loop."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.flush_usage)
+    
+    def log_usage_many(self, usages: List[TokenUsage]) -> bool:
+        """Log several usage records in a single transaction."""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.execute("""
-                    INSERT INTO token_usage (
-                        id, token_id, timestamp, tool_name, success, 
-                        ip_address, user_agent, response_time_ms, error_message
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    usage.id,
-                    usage.token_id,
-                    usage.timestamp.isoformat(),
-                    usage.tool_name,
-                    usage.success,
-                    usage.ip_address,
-                    usage.user_agent,
-                    usage.response_time_ms,
-                    usage.error_message
-                ))
+            with self._writer() as conn:
+                conn.executemany(_INSERT_USAGE, [self._usage_row(u) for u in usages])
+                return True
+        except Exception as e:
+            print(f"Error logging usage: {e}")
+            return False
+    
+    def _start_flush_thread(self):
+        """Start the background thread that drains the usage buffer."""
+        with self._usage_lock:
+            if self._flush_thread is None:
+                self._flush_thread = threading.Thread(target=self._flush_loop, daemon=True)
+                self._flush_thread.start()
+    
+    def _flush_loop(self):
+        """Periodically write buffered usage rows."""
+        while True:
+            self._flush_event.wait(USAGE_FLUSH_INTERVAL)
+            self._flush_event.clear()
+            self.flush_usage()
+    
+    def flush_usage(self) -> bool:
+        """Write all buffered usage rows in one transaction."""
+        with self._usage_lock:
+            rows, self._usage_buffer = self._usage_buffer, []
+        if not rows:
+            return True
+        
+        try:
+            with self._writer() as conn:
+                conn.executemany(_INSERT_USAGE, rows)
                 return True
         except Exception as e:
             print(f"Error logging usage: {e}")
@@ -347,39 +576,41 @@ class TokenDatabase:
     
     def get_usage_stats(self, token_id: str, hours: int = 24) -> Dict[str, Any]:
         """Get usage statistics for a token."""
+        self.flush_usage()
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
-                since = datetime.now() - timedelta(hours=hours)
+            with self._reader() as conn:
+                since_ms = int((time.time() - hours * 3600) * 1000)
                 
-                # Total requests in time period
-                cursor = conn.execute("""
-                    SELECT COUNT(*) as total_requests,
-                           SUM(CASE WHEN success = 1 THEN 1 ELSE 0 END) as successful_requests,
-                           AVG(response_time_ms) as avg_response_time
-                    FROM token_usage 
-                    WHERE token_id = ? AND timestamp >= ?
-                """, (token_id, since.isoformat()))
-                
-                stats = dict(cursor.fetchone())
-                
-                # Requests by tool
-                cursor = conn.execute("""
-                    SELECT tool_name, COUNT(*) as count
+                # Per-tool aggregates in one pass; the totals are summed from them
+                cursor = conn.cursor()
+                cursor.row_factory = sqlite3.Row
+                cursor.execute("""
+                    SELECT tool_name, COUNT(*) as count,
+                           SUM(CASE WHEN success = 1 THEN 1 ELSE 0 END) as successful,
+                           SUM(response_time_ms) as response_time_total,
+                           COUNT(response_time_ms) as response_time_count
                     FROM token_usage 
                     WHERE token_id = ? AND timestamp >= ?
                     GROUP BY tool_name
                     ORDER BY count DESC
-                """, (token_id, since.isoformat()))
+                """, (token_id, since_ms))
                 
-                tools_usage = [dict(row) for row in cursor.fetchall()]
+                total_requests = successful_requests = 0
+                response_time_total = response_time_count = 0
+                tools_usage = []
+                for row in cursor:
+                    total_requests += row["count"]
+                    successful_requests += row["successful"]
+                    response_time_total += row["response_time_total"] or 0
+                    response_time_count += row["response_time_count"]
+                    tools_usage.append({"tool_name": row["tool_name"], "count": row["count"]})
                 
                 return {
                     "period_hours": hours,
-                    "total_requests": stats["total_requests"] or 0,
-                    "successful_requests": stats["successful_requests"] or 0,
-                    "error_rate": (stats["total_requests"] - (stats["successful_requests"] or 0)) / max(stats["total_requests"] or 1, 1),
-                    "avg_response_time_ms": stats["avg_response_time"] or 0,
+                    "total_requests": total_requests,
+                    "successful_requests": successful_requests,
+                    "error_rate": (total_requests - successful_requests) / max(total_requests, 1),
+                    "avg_response_time_ms": response_time_total / response_time_count if response_time_count else 0,
                     "tools_usage": tools_usage
                 }
         except Exception as e:
@@ -388,15 +619,69 @@ class TokenDatabase:
     
     def cleanup_old_usage(self, days: int = 30) -> bool:
         """Clean up old usage records."""
+        self.flush_usage()
         try:
-            cutoff = datetime.now() - timedelta(days=days)
-            with sqlite3.connect(self.db_path) as conn:
+            cutoff = time.time() - days * 86400
+            with self._writer() as conn:
                 cursor = conn.execute("""
                     DELETE FROM token_usage WHERE timestamp < ?
-                """, (cutoff.isoformat(),))
+                """, (int(cutoff * 1000),))
                 deleted_count = cursor.rowcount
+                conn.execute("DELETE FROM rate_limits WHERE bucket < ?",
+                             (int(cutoff) // 3600,))
                 print(f"Cleaned up {deleted_count} old usage records")
                 return True
         except Exception as e:
             print(f"Error cleaning up usage records: {e}")
-            return False
\ No newline at end of file
+            return False
+    
+    def is_rate_limited(self, token_id: str, rate_limit: int, window_hours: int = 1) -> bool:
+        """
+        Check a token's request count over the last window_hours hourly buckets,
+        and count this request if it is allowed.
+        
+        The check and increment run in one write transaction, so the limit is
+        shared by every process using the database.
+        """
+        bucket = int(time.time()) // 3600
+        try:
+            with self._writer() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                used = conn.execute("""
+                    SELECT COALESCE(SUM(count), 0) FROM rate_limits
+                    WHERE token_id = ? AND bucket > ?
+                """, (token_id, bucket - window_hours)).fetchone()[0]
+                if used >= rate_limit:
+                    return True
+                
+                conn.execute("""
+                    INSERT INTO rate_limits (token_id, bucket, count) VALUES (?, ?, 1)
+                    ON CONFLICT (token_id, bucket) DO UPDATE SET count = count + 1
+                """, (token_id, bucket))
+                return False
+        except Exception as e:
+            print(f"Error checking rate limit: {e}")
+            return False
+    
+    def get_rate_limit_count(self, token_id: str, window_hours: int = 1) -> int:
+        """Get a token's request count over the last window_hours hourly buckets."""
+        bucket = int(time.time()) // 3600
+        try:
+            with self._reader() as conn:
+                return conn.execute("""
+                    SELECT COALESCE(SUM(count), 0) FROM rate_limits
+                    WHERE token_id = ? AND bucket > ?
+                """, (token_id, bucket - window_hours)).fetchone()[0]
+        except Exception as e:
+            print(f"Error getting rate limit count: {e}")
+            return 0
+    
+    def reset_rate_limit(self, token_id: str) -> bool:
+        """Clear a token's rate limit counters."""
+        try:
+            with self._writer() as conn:
+                conn.execute("DELETE FROM rate_limits WHERE token_id = ?", (token_id,))
+                return True
+        except Exception as e:
+            print(f"Error resetting rate limit: {e}")
+            return False
@@ -5,12 +5,16 @@ Provides secure token generation, hashing, and validation functionality
 
 import hashlib
 import secrets
-import string
 import hmac
-from datetime import datetime, timedelta
-from typing import Optional, Tuple
+import math
+from datetime import datetime
+from typing import Dict, Optional, Tuple, Union
 import base64
 import os
+import re
+import functools
+import ipaddress
+import time
 
 
 class TokenSecurity:
@@ -20,10 +24,15 @@ class TokenSecurity:
     TOKEN_PREFIX = "enact_"
     TOKEN_LENGTH = 32  # Length of random part
     HASH_ALGORITHM = "sha256"
+    _TOKEN_RE = re.compile(rf"{re.escape(TOKEN_PREFIX)}[A-Za-z0-9_-]{{{TOKEN_LENGTH}}}")
     
     def __init__(self, secret_key: Optional[str] = None):
         """Initialize token security with optional secret key."""
         self.secret_key = secret_key or os.getenv("TOKEN_SECRET_KEY", self._generate_secret_key())
+        # Keyed hash states, copied per call instead of re-deriving the key each time
+        key = self.secret_key.encode()
+        self._hmac_template = hmac.new(key, None, hashlib.sha256)
+        self._recovery_template = hashlib.sha256(key)
     
     @staticmethod
     def _generate_secret_key() -> str:
@@ -32,33 +41,20 @@ class TokenSecurity:
     
     def generate_token(self) -> str:
         """Generate a new secure token."""
-        # Use a mix of letters and numbers for the random part
-        alphabet = string.ascii_letters + string.digits
-        random_part = ''.join(secrets.choice(alphabet) for _ in range(self.TOKEN_LENGTH))
-        return f"{self.TOKEN_PREFIX}{random_part}"
+        # base64url yields 4 characters per 3 bytes, so this many bytes always
+        # covers TOKEN_LENGTH characters
+        nbytes = math.ceil(self.TOKEN_LENGTH * 3 / 4)
+        return self.TOKEN_PREFIX + secrets.token_urlsafe(nbytes)[:self.TOKEN_LENGTH]
     
     def hash_token(self, token: str) -> str:
         """Hash a token using HMAC-SHA256."""
-        return hmac.new(
-            self.secret_key.encode(),
-            token.encode(),
-            hashlib.sha256
-        ).hexdigest()
+        h = self._hmac_template.copy()
+        h.update(token.encode())
+        return h.hexdigest()
     
     def verify_token_format(self, token: str) -> bool:
         """Verify that a token has the correct format."""
-        if not token.startswith(self.TOKEN_PREFIX):
-            return False
-        
-        # Check length
-        expected_length = len(self.TOKEN_PREFIX) + self.TOKEN_LENGTH
-        if len(token) != expected_length:
-            return False
-        
-        # Check that the random part contains only valid characters
-        random_part = token[len(self.TOKEN_PREFIX):]
-        valid_chars = set(string.ascii_letters + string.digits)
-        return all(c in valid_chars for c in random_part)
+        return self._TOKEN_RE.fullmatch(token) is not None
     
     def compare_tokens(self, token1: str, token2: str) -> bool:
         """Safely compare two tokens using constant-time comparison."""
@@ -90,11 +86,13 @@ class TokenSecurity:
         
         return token_id, raw_token, hashed_token
     
-    def is_token_expired(self, expires_at: Optional[datetime]) -> bool:
-        """Check if a token has expired."""
+    def is_token_expired(self, expires_at: Union[datetime, float, None]) -> bool:
+        """Check if a token has expired (expires_at as a datetime or unix epoch seconds)."""
         if expires_at is None:
             return False
-        return datetime.now() > expires_at
+        if isinstance(expires_at, datetime):
+            expires_at = expires_at.timestamp()
+        return time.time() > expires_at
     
     def generate_recovery_code(self) -> str:
         """Generate a recovery code for emergency access."""
@@ -102,20 +100,34 @@ class TokenSecurity:
     
     def hash_recovery_code(self, code: str) -> str:
         """Hash a recovery code."""
-        return hashlib.sha256(f"{self.secret_key}{code}".encode()).hexdigest()
+        h = self._recovery_template.copy()
+        h.update(code.encode())
+        return h.hexdigest()
 
 
 class RateLimiter:
-    """Simple rate limiter for token usage."""
+    """Token-bucket rate limiter for token usage."""
     
     def __init__(self):
         """Initialize the rate limiter."""
-        self.usage_windows = {}  # token_id -> list of timestamps
+        # token_id -> (tokens_remaining, last_refill, capacity), times from time.monotonic()
+        self.buckets: Dict[str, Tuple[float, float, int]] = {}
+    
+    def _refill(self, token_id: str, rate_limit: int, window_hours: int, now: float) -> float:
+        """Return the tokens available to a bucket at time now."""
+        bucket = self.buckets.get(token_id)
+        if bucket is None:
+            return float(rate_limit)
+        remaining, last, _ = bucket
+        return min(float(rate_limit), remaining + (now - last) * rate_limit / (window_hours * 3600))
     
     def is_rate_limited(self, token_id: str, rate_limit: int, window_hours: int = 1) -> bool:
         """
         Check if a token has exceeded its rate limit.
         
+        The bucket holds up to rate_limit requests and refills continuously
+        at rate_limit per window.
+        
         Args:
             token_id: The token identifier
             rate_limit: Maximum requests per window
@@ -124,43 +136,61 @@ class RateLimiter:
         Returns:
             True if rate limited, False otherwise
         """
-        now = datetime.now()
-        window_start = now - timedelta(hours=window_hours)
-        
-        # Clean up old entries
-        if token_id in self.usage_windows:
-            self.usage_windows[token_id] = [
-                timestamp for timestamp in self.usage_windows[token_id]
-                if timestamp > window_start
-            ]
-        else:
-            self.usage_windows[token_id] = []
+        now = time.monotonic()
+        remaining = self._refill(token_id, rate_limit, window_hours, now)
         
         # Check if rate limit exceeded
-        if len(self.usage_windows[token_id]) >= rate_limit:
+        if remaining < 1:
+            self.buckets[token_id] = (remaining, now, rate_limit)
             return True
         
         # Record this usage
-        self.usage_windows[token_id].append(now)
+        self.buckets[token_id] = (remaining - 1, now, rate_limit)
         return False
     
     def get_usage_count(self, token_id: str, window_hours: int = 1) -> int:
         """Get current usage count for a token in the time window."""
-        now = datetime.now()
-        window_start = now - timedelta(hours=window_hours)
-        
-        if token_id not in self.usage_windows:
+        bucket = self.buckets.get(token_id)
+        if bucket is None:
             return 0
         
-        return len([
-            timestamp for timestamp in self.usage_windows[token_id]
-            if timestamp > window_start
-        ])
+        capacity = bucket[2]
+        remaining = self._refill(token_id, capacity, window_hours, time.monotonic())
+        return round(capacity - remaining)
     
     def reset_usage(self, token_id: str):
         """Reset usage tracking for a token."""
-        if token_id in self.usage_windows:
-            del self.usage_windows[token_id]
+        self.buckets.pop(token_id, None)
+
+
+class DatabaseRateLimiter:
+    """Rate limiter backed by the token database's rate_limits table.
+    
+    Counts survive restarts and are shared by every process using the same
+    database. Drop-in replacement for RateLimiter in TokenValidator.
+    
+    Requests are counted in fixed hourly buckets rather than a sliding
+    window, so a token can make up to twice its limit across an hour
+    boundary (a full limit at the end of one hour and again at the start
+    of the next). Database errors fail open: the request is allowed and
+    the error is printed.
+    """
+    
+    def __init__(self, db):
+        """Initialize with a token_models.TokenDatabase."""
+        self.db = db
+    
+    def is_rate_limited(self, token_id: str, rate_limit: int, window_hours: int = 1) -> bool:
+        """Check if a token has exceeded its rate limit."""
+        return self.db.is_rate_limited(token_id, rate_limit, window_hours)
+    
+    def get_usage_count(self, token_id: str, window_hours: int = 1) -> int:
+        """Get current usage count for a token in the time window."""
+        return self.db.get_rate_limit_count(token_id, window_hours)
+    
+    def reset_usage(self, token_id: str):
+        """Reset usage tracking for a token."""
+        self.db.reset_rate_limit(token_id)
 
 
 class IPValidator:
@@ -170,12 +200,31 @@ class IPValidator:
     def is_valid_ip(ip_address: str) -> bool:
         """Check if an IP address is valid."""
         try:
-            import ipaddress
             ipaddress.ip_address(ip_address)
             return True
         except ValueError:
             return False
     
+    @staticmethod
+    @functools.lru_cache(maxsize=256)
+    def parse_whitelist(whitelist: tuple) -> Tuple[frozenset, tuple]:
+        """
+        Split a whitelist into exact addresses and parsed CIDR networks.
+        
+        CIDR entries that fail to parse are reported and skipped, so one bad
+        entry does not reject every address.
+        """
+        exact = frozenset(entry for entry in whitelist if '/' not in entry)
+        networks = []
+        for entry in whitelist:
+            if '/' not in entry:
+                continue
+            try:
+                networks.append(ipaddress.ip_network(entry, strict=False))
+            except ValueError as e:
+                print(f"Ignoring invalid IP whitelist entry {entry!r}: {e}")
+        return exact, tuple(networks)
+    
     @staticmethod
     def is_ip_in_whitelist(ip_address: str, whitelist: list) -> bool:
         """Check if an IP address is in the whitelist."""
@@ -183,19 +232,17 @@ class IPValidator:
             return True  # No whitelist means all IPs allowed
         
         try:
-            import ipaddress
+            exact, networks = IPValidator.parse_whitelist(tuple(whitelist))
             ip = ipaddress.ip_address(ip_address)
             
-            for allowed in whitelist:
-                # Handle CIDR notation
-                if '/' in allowed:
-                    network = ipaddress.ip_network(allowed, strict=False)
-                    if ip in network:
-                        return True
-                else:
-                    # Exact IP match
-                    if str(ip) == allowed:
-                        return True
+            # Exact IP match
+            if str(ip) in exact:
+                return True
+            
+            # CIDR notation
+            for network in networks:
+                if ip in network:
+                    return True
             
             return False
         except Exception:
@@ -221,6 +268,9 @@ class TokenValidator:
         Returns:
             (is_valid, error_message)
         """
+        # Cheapest checks first: a precompiled regex match, dict lookups and
+        # membership tests, then IP parsing, then the rate limiter
+        
         # Basic format validation
         if not self.security.verify_token_format(token):
             return False, "Invalid token format"
@@ -229,9 +279,9 @@ class TokenValidator:
         if not token_data.get('is_active', False):
             return False, "Token is inactive or revoked"
         
-        # Check expiration
-        expires_at = token_data.get('expires_at')
-        if expires_at and self.security.is_token_expired(expires_at):
+        # Check expiration (token_data is left untouched so callers can still
+        # serialize it)
+        if self.security.is_token_expired(token_data.get('expires_at')):
             return False, "Token has expired"
         
         # Check tool permissions
@@ -254,10 +304,22 @@ class TokenValidator:
 
 
 # Utility functions for integration
-def setup_token_security() -> Tuple[TokenSecurity, RateLimiter, TokenValidator]:
-    """Set up the complete token security system."""
+def setup_token_security(db=None) -> Tuple[TokenSecurity, Union[RateLimiter, DatabaseRateLimiter], TokenValidator]:
+    """
+    Set up the complete token security system.
+    
+    Rate limits are kept in the token database when db (a TokenDatabase) is
+    given, or when the rate_limiting.backend setting is "database";
+    otherwise they are tracked in this process only.
+    """
     security = TokenSecurity()
-    rate_limiter = RateLimiter()
+    if db is None:
+        from token_config import get_config
+        config = get_config()
+        if config.rate_limiting.backend == "database":
+            from token_models import TokenDatabase
+            db = TokenDatabase(config.database.path)
+    rate_limiter = DatabaseRateLimiter(db) if db is not None else RateLimiter()
     validator = TokenValidator(security, rate_limiter)
     
     return security, rate_limiter, validator
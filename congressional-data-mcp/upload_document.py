@@ -4,94 +4,163 @@ Document Upload Script for Congressional MCP Server
 Upload PDFs, text files, and other documents to the knowledge base
 """
 
+import functools
 import os
+import re
 import sys
-import argparse
-from pathlib import Path
-from document_store import DocumentStore
+from collections import defaultdict
+
+VERSION = "1.0.0"
+
+# Separator for the --tags option; absorbs whitespace around each comma
+_TAG_RE = re.compile(r'\s*,\s*')
+
+# File extensions picked up by upload-dir
+DOCUMENT_EXTENSIONS = frozenset({'pdf', 'txt', 'md', 'json', 'html'})
+
+# Quiet upload-dir runs report progress once per this many files; on a
+# terminal a single status line is redrawn every PROGRESS_REDRAW_EVERY files
+PROGRESS_EVERY = 100
+PROGRESS_REDRAW_EVERY = 10
 
 def upload_file(filepath: str, 
                 title: str = None,
                 description: str = None,
                 category: str = None,
-                tags: str = None):
-    """Upload a file to the document store"""
+                tags: str = None,
+                store=None,
+                verbose: bool = True):
+    """Upload a file to the document store (a new DocumentStore unless store is given)"""
+    
+    # Parse tags
+    tag_list = [t for t in _TAG_RE.split(tags.strip()) if t] if tags else []
     
-    filepath = Path(filepath)
-    if not filepath.exists():
+    filepath = os.fspath(filepath)
+    return _upload(filepath, os.path.basename(filepath), store, title, description,
+                   category, tag_list, verbose)
+
+def _upload(filepath: str, filename: str, store, title, description, category,
+            tag_list: list, verbose: bool = True) -> bool:
+    """Upload one file given as a path string and its base name, with tags already split"""
+    try:
+        f = open(filepath, 'rb', buffering=1 << 20)
+    except FileNotFoundError:
         print(f"❌ File not found: {filepath}")
         return False
     
-    # Initialize document store
-    store = DocumentStore()
+    with f:
+        # Initialize document store (imported here so --help and bad
+        # invocations don't pay for it)
+        if store is None:
+            from document_store import DocumentStore
+            store = DocumentStore()
+        
+        # Stream the file into the store rather than reading it into memory
+        size = os.fstat(f.fileno()).st_size
+        doc_id = store.store_document_stream(
+            f,
+            filename=filename,
+            title=title or os.path.splitext(filename)[0],
+            description=description,
+            category=category,
+            tags=tag_list
+        )
     
-    # Read file content
-    with open(filepath, 'rb') as f:
-        content = f.read()
+    if not verbose:
+        return True
     
-    # Parse tags
-    tag_list = [t.strip() for t in tags.split(',')] if tags else []
-    
-    # Store document
-    doc_id = store.store_document(
-        content=content,
-        filename=filepath.name,
-        title=title or filepath.stem,
-        description=description,
-        category=category,
-        tags=tag_list
-    )
-    
-    print(f"✅ Document uploaded successfully!")
-    print(f"   ID: {doc_id}")
-    print(f"   Title: {title or filepath.name}")
-    print(f"   Category: {category or 'uncategorized'}")
-    print(f"   Tags: {', '.join(tag_list) if tag_list else 'none'}")
-    print(f"   Size: {len(content):,} bytes")
+    # One print, so concurrent uploads don't interleave their lines
+    print(f"✅ Document uploaded successfully!\n"
+          f"   ID: {doc_id}\n"
+          f"   Title: {title or filename}\n"
+          f"   Category: {category or 'uncategorized'}\n"
+          f"   Tags: {', '.join(tag_list) if tag_list else 'none'}\n"
+          f"   Size: {size:,} bytes")
     
     return True
 
-def upload_directory(directory: str, category: str = None):
-    """Upload all documents in a directory"""
-    dirpath = Path(directory)
-    if not dirpath.exists():
+@functools.lru_cache(maxsize=4096)
+def _pretty(stem: str) -> str:
+    """Turn a filename stem like 'house_rules' into a title ('House Rules')"""
+    return stem.replace('_', ' ').title()
+
+def upload_directory(directory: str, category: str = None, verbose: bool = False):
+    """Upload all documents in a directory (per-file details only when verbose)"""
+    dirpath = os.path.normpath(directory)
+    
+    # Find all documents in one pass over the directory, keeping plain
+    # (path, name) strings for the per-file work
+    try:
+        with os.scandir(dirpath) as entries:
+            files = [
+                (entry.path, entry.name) for entry in entries
+                if entry.is_file(follow_symlinks=False)
+                and os.path.splitext(entry.name)[1][1:].lower() in DOCUMENT_EXTENSIONS
+            ]
+    except (FileNotFoundError, NotADirectoryError):
         print(f"❌ Directory not found: {dirpath}")
         return False
     
-    # Find all documents
-    patterns = ['*.pdf', '*.txt', '*.md', '*.json', '*.html']
-    files = []
-    for pattern in patterns:
-        files.extend(dirpath.glob(pattern))
-    
     if not files:
         print(f"❌ No documents found in {dirpath}")
         return False
     
     print(f"Found {len(files)} documents to upload...")
     
-    success_count = 0
-    for filepath in files:
-        print(f"\nUploading: {filepath.name}")
-        
-        # Auto-detect category from subdirectory
-        if not category and filepath.parent != dirpath:
-            category = filepath.parent.name
-        
-        success = upload_file(
-            str(filepath),
-            title=filepath.stem.replace('_', ' ').title(),
-            category=category
-        )
-        
-        if success:
-            success_count += 1
+    # One store and one transaction for the whole directory
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    from document_store import DocumentStore
+    store = DocumentStore()
     
-    print(f"\n📊 Summary: {success_count}/{len(files)} documents uploaded successfully")
+    def upload(filepath: str, filename: str) -> bool:
+        if verbose:
+            print(f"\nUploading: {filename}")
+        parent = os.path.dirname(filepath)
+        # A failing file counts as a failure rather than escaping into
+        # store.batch() and rolling back the whole directory
+        try:
+            return _upload(
+                filepath, filename, store,
+                _pretty(os.path.splitext(filename)[0]),
+                None,
+                # Auto-detect category from subdirectory
+                category or (os.path.basename(parent) if parent != dirpath else None),
+                [],
+                verbose
+            )
+        except Exception as e:
+            print(f"❌ Failed to upload {filename}: {e}")
+            return False
+    
+    # Reading and hashing run in parallel; the store serializes its DB writes
+    total = len(files)
+    redraw = not verbose and sys.stdout.isatty()
+    success_count = 0
+    with store.batch(), ThreadPoolExecutor(max_workers=min(8, (os.cpu_count() or 1) * 2)) as pool:
+        futures = {
+            pool.submit(upload, filepath, filename): filename
+            for filepath, filename in files
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            if future.result():
+                success_count += 1
+            if verbose:
+                continue
+            if redraw:
+                if done % PROGRESS_REDRAW_EVERY == 0 or done == total:
+                    sys.stdout.write(f"\rUploading [{done}/{total}]: {futures[future][:60]:<60}")
+                    sys.stdout.flush()
+            elif done % PROGRESS_EVERY == 0:
+                print(f"  {done}/{total} files processed")
+    if redraw:
+        sys.stdout.write("\n")
+    
+    print(f"\n📊 Summary: {success_count}/{total} documents uploaded successfully")
     return success_count > 0
 
 def list_documents():
     """List all documents in the store"""
+    from document_store import DocumentStore
     store = DocumentStore()
     documents = store.search_documents()
     
@@ -99,29 +168,29 @@ def list_documents():
         print("No documents found in the store")
         return
     
-    print(f"\n📚 Document Library ({len(documents)} documents)")
-    print("=" * 60)
+    out = [f"\n📚 Document Library ({len(documents)} documents)", "=" * 60]
     
     # Group by category
-    by_category = {}
+    by_category = defaultdict(list)
     for doc in documents:
-        cat = doc.get('category', 'uncategorized')
-        if cat not in by_category:
-            by_category[cat] = []
-        by_category[cat].append(doc)
+        by_category[doc.get('category') or 'uncategorized'].append(doc)
     
     for category, docs in sorted(by_category.items()):
-        print(f"\n{category.upper()}")
-        print("-" * 40)
-        for doc in docs:
-            size_kb = doc['size'] / 1024
-            print(f"  [{doc['id']}] {doc['title']}")
-            print(f"         {size_kb:.1f} KB | {doc.get('filename', 'unknown')}")
-            if doc.get('tags'):
-                print(f"         Tags: {', '.join(doc['tags'])}")
+        out.append(f"\n{category.upper()}")
+        out.append("-" * 40)
+        # One preformatted entry per document
+        out.extend(
+            f"  [{doc['id']}] {doc['title']}\n"
+            f"         {doc['size'] / 1024:.1f} KB | {doc.get('filename', 'unknown')}"
+            + (f"\n         Tags: {', '.join(tags)}" if (tags := doc.get('tags')) else "")
+            for doc in docs
+        )
+    out.append("")
+    sys.stdout.write("\n".join(out))
 
 def search_documents(query: str):
     """Search for documents"""
+    from document_store import DocumentStore
     store = DocumentStore()
     results = store.search_documents(query=query)
     
@@ -129,74 +198,128 @@ def search_documents(query: str):
         print(f"No documents found matching '{query}'")
         return
     
-    print(f"\n🔍 Search Results for '{query}' ({len(results)} matches)")
-    print("=" * 60)
+    out = [f"\n🔍 Search Results for '{query}' ({len(results)} matches)", "=" * 60]
     
     for doc in results:
-        print(f"\n[{doc['id']}] {doc['title']}")
-        if doc.get('description'):
-            print(f"  {doc['description']}")
-        print(f"  Category: {doc.get('category', 'uncategorized')}")
-        if doc.get('tags'):
-            print(f"  Tags: {', '.join(doc['tags'])}")
+        description = doc.get('description')
+        tags = doc.get('tags')
+        out.append(f"\n[{doc['id']}] {doc['title']}")
+        if description:
+            out.append(f"  {description}")
+        out.append(f"  Category: {doc.get('category') or 'uncategorized'}")
+        if tags:
+            out.append(f"  Tags: {', '.join(tags)}")
+    out.append("")
+    sys.stdout.write("\n".join(out))
+
+USAGE = """usage: upload_document.py <command> [options]
+
+Upload and manage documents in the Congressional MCP knowledge base
+
+commands:
+  upload FILE           Upload a document
+      --title TITLE               Document title
+      --description DESCRIPTION   Document description
+      --category CATEGORY         Category (e.g., legislative_process, rules)
+      --tags TAGS                 Comma-separated tags
+  upload-dir DIRECTORY  Upload all documents in a directory
+      --category CATEGORY         Category for all documents
+  list                  List all documents
+  search QUERY          Search documents
+  load-defaults         Load default Congressional documents
+
+options:
+  -h, --help            Show this message and exit
+  --version             Show the version and exit
+"""
+
+# command -> (positional arguments, accepted --options)
+COMMANDS = {
+    'upload': (('file',), ('title', 'description', 'category', 'tags')),
+    'upload-dir': (('directory',), ('category',)),
+    'list': ((), ()),
+    'search': (('query',), ()),
+    'load-defaults': ((), ()),
+}
+
+def _usage_error(message: str):
+    sys.stderr.write(f"{USAGE}\nupload_document.py: error: {message}\n")
+    sys.exit(2)
+
+def parse_args(argv: list) -> tuple:
+    """Parse argv into (command, {argument: value}); exits on -h or bad usage"""
+    if not argv or argv[0] in ('-h', '--help'):
+        sys.stdout.write(USAGE)
+        sys.exit(0)
+    
+    command = argv[0]
+    if command not in COMMANDS:
+        _usage_error(f"invalid command: '{command}' (choose from {', '.join(COMMANDS)})")
+    positional_names, option_names = COMMANDS[command]
+    
+    args = dict.fromkeys(option_names)
+    positional = []
+    rest = iter(argv[1:])
+    for arg in rest:
+        if arg in ('-h', '--help'):
+            sys.stdout.write(USAGE)
+            sys.exit(0)
+        if arg.startswith('--'):
+            name, has_value, value = arg[2:].partition('=')
+            if name not in option_names:
+                _usage_error(f"unrecognized argument: {arg}")
+            if not has_value:
+                value = next(rest, None)
+                if value is None:
+                    _usage_error(f"argument --{name}: expected one argument")
+            args[name] = value
+        else:
+            positional.append(arg)
+    
+    if len(positional) < len(positional_names):
+        missing = ', '.join(positional_names[len(positional):])
+        _usage_error(f"the following arguments are required: {missing}")
+    if len(positional) > len(positional_names):
+        _usage_error(f"unrecognized arguments: {' '.join(positional[len(positional_names):])}")
+    args.update(zip(positional_names, positional))
+    
+    return command, args
 
 def main():
-    parser = argparse.ArgumentParser(
-        description="Upload and manage documents in the Congressional MCP knowledge base"
-    )
-    
-    subparsers = parser.add_subparsers(dest='command', help='Commands')
-    
-    # Upload file command
-    upload_parser = subparsers.add_parser('upload', help='Upload a document')
-    upload_parser.add_argument('file', help='Path to file to upload')
-    upload_parser.add_argument('--title', help='Document title')
-    upload_parser.add_argument('--description', help='Document description')
-    upload_parser.add_argument('--category', help='Category (e.g., legislative_process, rules)')
-    upload_parser.add_argument('--tags', help='Comma-separated tags')
-    
-    # Upload directory command
-    dir_parser = subparsers.add_parser('upload-dir', help='Upload all documents in a directory')
-    dir_parser.add_argument('directory', help='Path to directory')
-    dir_parser.add_argument('--category', help='Category for all documents')
-    
-    # List command
-    list_parser = subparsers.add_parser('list', help='List all documents')
-    
-    # Search command
-    search_parser = subparsers.add_parser('search', help='Search documents')
-    search_parser.add_argument('query', help='Search query')
-    
-    # Load defaults command
-    load_parser = subparsers.add_parser('load-defaults', help='Load default Congressional documents')
+    # Answer help/version straight from the pre-built strings, before any
+    # argument parsing or store imports
+    argv = sys.argv[1:]
+    if not argv or argv[0] in ('-h', '--help'):
+        sys.stdout.write(USAGE)
+        return
+    if argv[0] == '--version':
+        sys.stdout.write(f"upload_document.py {VERSION}\n")
+        return
     
-    args = parser.parse_args()
+    command, args = parse_args(argv)
     
-    if args.command == 'upload':
+    if command == 'upload':
         upload_file(
-            args.file,
-            title=args.title,
-            description=args.description,
-            category=args.category,
-            tags=args.tags
+            args['file'],
+            title=args['title'],
+            description=args['description'],
+            category=args['category'],
+            tags=args['tags']
         )
     
-    elif args.command == 'upload-dir':
-        upload_directory(args.directory, category=args.category)
+    elif command == 'upload-dir':
+        upload_directory(args['directory'], category=args['category'])
     
-    elif args.command == 'list':
+    elif command == 'list':
         list_documents()
     
-    elif args.command == 'search':
-        search_documents(args.query)
+    elif command == 'search':
+        search_documents(args['query'])
     
-    elif args.command == 'load-defaults':
+    elif command == 'load-defaults':
         from document_store import load_default_documents
         load_default_documents()
         print("✅ Default Congressional documents loaded")
-    
-    else:
-        parser.print_help()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()